@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Hobby
+from .models import CustomUser, Friendship, Hobby, Job
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -13,7 +13,6 @@ class CustomUserAdmin(UserAdmin):
         (None, {'fields': ('email', 'password')}),
         ('Personal Info', {'fields': ('name', 'date_of_birth', 'hobbies')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
-        ('Relationships', {'fields': ('friends',)}),
     )
 
     add_fieldsets = (
@@ -35,3 +34,14 @@ class CustomUserAdmin(UserAdmin):
 class HobbyAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
     search_fields = ('name',)
+
+@admin.register(Friendship)
+class FriendshipAdmin(admin.ModelAdmin):
+    list_display = ('id', 'low', 'high')
+    raw_id_fields = ('low', 'high')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'key', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('key',)
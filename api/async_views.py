@@ -0,0 +1,139 @@
+"""
+Native async versions of the read-heavy API views, served instead of their
+sync counterparts in ``api.views`` when ``SERVER_MODE`` is ``"asgi"``.
+
+Database access goes through the async ORM. Work on the in-process indexes
+(ranking, index rebuilds) and the cache helpers runs via ``sync_to_async``,
+because it may block or touch the database.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_http_methods
+
+from project.replicas import primary_reads
+
+from . import views
+from .cache import (
+    auser_snapshot, catalogue_version, get_catalogue, get_similar_users, set_catalogue, set_similar_users,
+    similar_users_key,
+)
+from .models import CustomUser, Hobby
+from .similarity import rank_similar_users_page, similar_users_data
+
+
+# Fetch the current user's profile data
+@login_required
+async def profile_api(request: HttpRequest) -> HttpResponse:
+    if request.method == "GET":
+        user = await request.auser()
+        return views.snapshot_response({"success": True}, "data", await auser_snapshot(user))
+    return JsonResponse({"success": False, "message": "Invalid request method."}, status=405)
+
+
+# Async version of views.load_catalogue()
+async def load_catalogue() -> tuple:
+    version = await sync_to_async(catalogue_version)()
+    bodies = await sync_to_async(get_catalogue)(version)
+    if bodies is None:
+        with primary_reads():
+            bodies = views.catalogue_bodies([row async for row in Hobby.objects.all().values("id", "name")])
+        await sync_to_async(set_catalogue)(version, bodies)
+    return bodies
+
+
+# Fetch all hobbies; adding one is left to the sync view
+async def hobbies_api(request: HttpRequest) -> HttpResponse:
+    if request.method != "GET":
+        return await sync_to_async(views.hobbies_api)(request)
+
+    return views.catalogue_response(request, await load_catalogue())
+
+
+@login_required
+async def similar_users(request: HttpRequest) -> JsonResponse:
+    current_user = await request.auser()
+
+    cache_key = await sync_to_async(similar_users_key)(current_user.id, request.GET)
+    cached = await sync_to_async(get_similar_users)(cache_key)
+    if cached is not None:
+        return JsonResponse(cached)
+
+    try:
+        ranked, mode, page_fields = await sync_to_async(rank_similar_users_page)(current_user.id, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The page is cached for other requests too, so it is filled from the primary.
+    with primary_reads():
+        profiles = {
+            user.id: user
+            async for user in CustomUser.objects.only('id', 'name', 'date_of_birth').filter(
+                id__in=[user_id for user_id, _, _ in ranked]
+            )
+        }
+        sent_request_ids = {
+            user_id async for user_id in current_user.sent_requests.filter(
+                status='pending'
+            ).values_list('to_user_id', flat=True)
+        }
+        friend_ids = await current_user.afriend_ids()
+
+    response = {
+        'users': similar_users_data(ranked, mode, profiles, friend_ids, sent_request_ids),
+        **page_fields,
+    }
+    await sync_to_async(set_similar_users)(cache_key, response)
+    return JsonResponse(response)
+
+
+@login_required
+async def list_friends(request: HttpRequest) -> JsonResponse:
+    user = await request.auser()
+    friends = CustomUser.objects.filter(id__in=await user.afriend_ids()).values('id', 'name', 'email')
+    friends_data = [friend async for friend in friends]
+    return JsonResponse({'friends': friends_data}, safe=False)
+
+
+@login_required
+async def list_sent_requests(request: HttpRequest) -> JsonResponse:
+    user = await request.auser()
+    sent_requests = user.get_sent_requests().select_related('to_user')
+    sent_requests_data = [
+        {'id': fr.id, 'to_user': fr.to_user.name, 'status': fr.status, 'created_at': fr.created_at}
+        async for fr in sent_requests
+    ]
+    return JsonResponse({'sent_requests': sent_requests_data}, safe=False)
+
+
+@login_required
+async def list_received_requests(request: HttpRequest) -> JsonResponse:
+    user = await request.auser()
+    received_requests = user.get_received_requests().select_related('from_user')
+    received_requests_data = [
+        {'id': fr.id, 'from_user': fr.from_user.name, 'status': fr.status, 'created_at': fr.created_at}
+        async for fr in received_requests
+    ]
+    return JsonResponse({'received_requests': received_requests_data}, safe=False)
+
+
+# Everything the SPA loads on start-up, as views.bootstrap
+@ensure_csrf_cookie
+@require_http_methods(["GET"])
+async def bootstrap(request: HttpRequest) -> HttpResponse:
+    known = parse_etags(request.headers.get("If-None-Match", ""))
+    sections = {}
+
+    bodies = await load_catalogue()
+    sections["hobbies"] = views.bootstrap_section(views.catalogue_etag(bodies), bodies[0], known)
+
+    user = await request.auser()
+    if user.is_authenticated:
+        snapshot = await auser_snapshot(user)
+        sections["profile"] = views.bootstrap_section(views.content_etag("profile", snapshot), snapshot, known)
+        friends = [friend async for friend in views.bootstrap_friends(user)]
+        pending = [fr async for fr in views.bootstrap_pending_requests(user)]
+        sections.update(views.bootstrap_friend_sections(user.id, friends, pending, known))
+    return views.bootstrap_response(request, user.is_authenticated, sections)
@@ -0,0 +1,214 @@
+"""
+Response caches for the read-heavy API views.
+
+Cached ``similar_users`` responses
+----------------------------------
+
+Entries are keyed by the viewer, the request parameters and a set of
+generation tokens: one global, one for the viewer and one for each of the
+viewer's hobbies. The signal handlers in ``api.signals`` replace the relevant
+tokens when data changes, which makes every entry built from the old data
+unreachable; those entries then age out of the cache on their own.
+
+Hobby catalogue
+---------------
+The full ``hobbies_api`` listing is stored pre-serialized and pre-compressed,
+with a hash of its content that the views use as the ETag, under a catalogue
+version. The version is replaced whenever a hobby is created, renamed or
+deleted, and expires with the entry, so the ETag only changes when the
+catalogue does.
+
+User snapshots
+--------------
+Each user's profile (id, name, email, date of birth and hobbies), as served by
+the profile, login and signup views, is stored as JSON bytes under a
+per-user version token plus a global one. Profile, hobby and password
+changes replace the user's token; renaming or deleting a hobby replaces the
+global one.
+
+Trending hobbies
+----------------
+The ``hobbies/trending/`` listing is cached per limit for
+``TRENDING_CACHE_TIMEOUT`` seconds and never evicted early.
+
+Generation tokens and versions live in the default cache, so deployments
+running several workers need a shared backend (Redis, Memcached) for
+evictions to reach all of them. With the per-process default, other workers
+pick up a new catalogue after ``HOBBY_CATALOGUE_TIMEOUT`` seconds.
+
+Versioned entries are served to every client, so their misses are filled
+inside ``project.replicas.primary_reads()``: a lagging replica would cache
+stale data under the new tokens.
+"""
+import hashlib
+import json
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from project.replicas import primary_reads
+
+from .models import CustomUser
+from .similarity import hobby_index
+
+# Query parameters that change the response of similar_users.
+SIMILAR_USERS_PARAMS = ("age_min", "age_max", "page", "score", "approx", "cursor", "total")
+
+_GLOBAL_KEY = "similar_users:gen"
+
+
+def _user_key(user_id: int) -> str:
+    return f"similar_users:gen:user:{user_id}"
+
+
+def _hobby_key(hobby_id: int) -> str:
+    return f"similar_users:gen:hobby:{hobby_id}"
+
+
+def _new_token() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _tokens(keys: List[str]) -> List[str]:
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # A missing token may have been culled, so never fall back to a
+            # fixed value that older entries could still match.
+            cache.add(key, _new_token(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def similar_users_key(user_id: int, params) -> str:
+    keys = [_GLOBAL_KEY, _user_key(user_id)]
+    keys += [_hobby_key(hobby_id) for hobby_id in sorted(hobby_index.hobbies_of(user_id))]
+    parts = [f"{name}={params.get(name, '')}" for name in SIMILAR_USERS_PARAMS]
+    digest = hashlib.md5("&".join(parts + _tokens(keys)).encode()).hexdigest()
+    return f"similar_users:{user_id}:{digest}"
+
+
+def get_similar_users(key: str) -> Optional[dict]:
+    return cache.get(key)
+
+
+def set_similar_users(key: str, response: dict) -> None:
+    cache.set(key, response, getattr(settings, "SIMILAR_USERS_CACHE_TIMEOUT", 60))
+
+
+def invalidate_users(user_ids: Iterable[int]) -> None:
+    """Evict cached results viewed by these users."""
+    cache.set_many({_user_key(user_id): _new_token() for user_id in user_ids}, None)
+
+
+def invalidate_hobbies(hobby_ids: Iterable[int]) -> None:
+    """Evict cached results of every user who has one of these hobbies."""
+    cache.set_many({_hobby_key(hobby_id): _new_token() for hobby_id in hobby_ids}, None)
+
+
+def invalidate_all() -> None:
+    cache.set(_GLOBAL_KEY, _new_token(), None)
+
+
+_CATALOGUE_VERSION_KEY = "hobbies:catalogue:version"
+
+
+def _catalogue_timeout() -> int:
+    return getattr(settings, "HOBBY_CATALOGUE_TIMEOUT", 60)
+
+
+def catalogue_version() -> str:
+    version = cache.get(_CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(_CATALOGUE_VERSION_KEY, _new_token(), _catalogue_timeout())
+        version = cache.get(_CATALOGUE_VERSION_KEY)
+    return version
+
+
+def get_catalogue(version: str) -> Optional[Tuple[bytes, bytes, str]]:
+    """The ``(json, gzipped json, content hash)`` of the hobby listing at ``version``."""
+    return cache.get(f"hobbies:catalogue:{version}")
+
+
+def set_catalogue(version: str, bodies: Tuple[bytes, bytes, str]) -> None:
+    cache.set(f"hobbies:catalogue:{version}", bodies, _catalogue_timeout())
+
+
+def bump_catalogue_version() -> None:
+    cache.set(_CATALOGUE_VERSION_KEY, _new_token(), _catalogue_timeout())
+
+
+def get_trending(limit: int) -> Optional[list]:
+    return cache.get(f"hobbies:trending:{limit}")
+
+
+def set_trending(limit: int, hobbies: list) -> None:
+    cache.set(f"hobbies:trending:{limit}", hobbies, getattr(settings, "TRENDING_CACHE_TIMEOUT", 60))
+
+
+_SNAPSHOT_GLOBAL_KEY = "users:snapshot:gen"
+
+
+def _snapshot_version_key(user_id: int) -> str:
+    return f"users:snapshot:gen:{user_id}"
+
+
+def _snapshot_key(user_id: int) -> str:
+    version = "-".join(_tokens([_SNAPSHOT_GLOBAL_KEY, _snapshot_version_key(user_id)]))
+    return f"users:snapshot:{user_id}:{version}"
+
+
+def _serialize_snapshot(user, hobby_rows: List[dict]) -> bytes:
+    return json.dumps({
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
+        "hobbies": hobby_rows,
+    }).encode()
+
+
+def user_snapshot(user, hobbies: Optional[Iterable] = None) -> bytes:
+    """
+    The serialized profile of ``user``. ``hobbies`` may be passed when the
+    caller already has the user's Hobby rows, to skip the query on a miss.
+    """
+    key = _snapshot_key(user.id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        with primary_reads():
+            if user._state.db != DEFAULT_DB_ALIAS:
+                user = CustomUser.objects.get(pk=user.pk)
+            if hobbies is None:
+                hobby_rows = list(user.hobbies.values("id", "name"))
+            else:
+                hobby_rows = [{"id": hobby.id, "name": hobby.name} for hobby in hobbies]
+        snapshot = _serialize_snapshot(user, hobby_rows)
+        cache.set(key, snapshot, getattr(settings, "USER_SNAPSHOT_TIMEOUT", 300))
+    return snapshot
+
+
+async def auser_snapshot(user) -> bytes:
+    """Async version of user_snapshot(), loading hobbies with the async ORM on a miss."""
+    key = await sync_to_async(_snapshot_key)(user.id)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        with primary_reads():
+            if user._state.db != DEFAULT_DB_ALIAS:
+                user = await CustomUser.objects.aget(pk=user.pk)
+            hobby_rows = [row async for row in user.hobbies.values("id", "name")]
+        snapshot = _serialize_snapshot(user, hobby_rows)
+        await cache.aset(key, snapshot, getattr(settings, "USER_SNAPSHOT_TIMEOUT", 300))
+    return snapshot
+
+
+def invalidate_user_snapshots(user_ids: Iterable[int]) -> None:
+    cache.set_many({_snapshot_version_key(user_id): _new_token() for user_id in user_ids}, None)
+
+
+def invalidate_all_user_snapshots() -> None:
+    cache.set(_SNAPSHOT_GLOBAL_KEY, _new_token(), None)
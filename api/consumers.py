@@ -0,0 +1,23 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .notifications import user_group
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes the events of ``api.notifications`` to the logged-in user's socket."""
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.group = user_group(user.id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group"):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def notify(self, message):
+        await self.send_json(message["event"])
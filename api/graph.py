@@ -0,0 +1,156 @@
+"""
+In-process snapshot of the friend graph for "people you may know".
+
+The snapshot is a CSR adjacency (``indptr`` offsets into a flat ``neighbors``
+array of user ids) built from the ``Friendship`` edges in one query, with
+every edge listed under both of its users. Friendships made or removed
+afterwards, e.g. by ``FriendRequest.accept``, are applied to
+small add/remove overlays by the signal handlers in ``api.signals``; the CSR
+arrays are rebuilt once the overlays grow past ``FRIEND_GRAPH_MAX_OVERLAY``
+edges or the snapshot is older than ``FRIEND_GRAPH_MAX_AGE`` seconds.
+"""
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Friendship
+from .similarity import hobby_index
+
+
+class FriendGraph:
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._built_at: Optional[float] = None
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.neighbors = np.empty(0, dtype=np.int64)
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._overlay_size = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._built_at = None
+
+    def ensure_built(self) -> None:
+        max_age = getattr(settings, "FRIEND_GRAPH_MAX_AGE", 300)
+        max_overlay = getattr(settings, "FRIEND_GRAPH_MAX_OVERLAY", 10000)
+        with self._lock:
+            if (
+                self._built_at is None
+                or time.monotonic() - self._built_at > max_age
+                or self._overlay_size > max_overlay
+            ):
+                self._build()
+
+    def _build(self) -> None:
+        # The overlay only holds changes since this read, so it must not come from a lagging replica.
+        friendships = Friendship.objects.using(DEFAULT_DB_ALIAS)
+        edges = np.array(friendships.values_list("low_id", "high_id"), dtype=np.int64).reshape(-1, 2)
+        edges = np.concatenate([edges, edges[:, ::-1]])
+        edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+        self.user_ids, counts = np.unique(edges[:, 0], return_counts=True)
+        self.indptr = np.zeros(len(self.user_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.neighbors = edges[:, 1].copy()
+        self._added, self._removed, self._overlay_size = {}, {}, 0
+        self._built_at = time.monotonic()
+
+    # Incremental updates, applied as overlays on top of the CSR arrays.
+
+    def add_edge(self, user_id: int, friend_id: int) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            removed = self._removed.get(user_id, set())
+            if friend_id in removed:
+                removed.discard(friend_id)
+            else:
+                self._added.setdefault(user_id, set()).add(friend_id)
+            self._overlay_size += 1
+
+    def remove_edge(self, user_id: int, friend_id: int) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            added = self._added.get(user_id, set())
+            if friend_id in added:
+                added.discard(friend_id)
+            else:
+                self._removed.setdefault(user_id, set()).add(friend_id)
+            self._overlay_size += 1
+
+    def add_friendship(self, user_id: int, friend_id: int) -> None:
+        with self._lock:
+            self.add_edge(user_id, friend_id)
+            self.add_edge(friend_id, user_id)
+
+    def remove_friendship(self, user_id: int, friend_id: int) -> None:
+        with self._lock:
+            self.remove_edge(user_id, friend_id)
+            self.remove_edge(friend_id, user_id)
+
+    # Queries
+
+    def _csr_neighbors(self, user_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Flat neighbor ids of ``user_ids`` from the CSR arrays, and the index of the owner of each."""
+        rows = np.searchsorted(self.user_ids, user_ids)
+        found = rows < len(self.user_ids)
+        found[found] = self.user_ids[rows[found]] == user_ids[found]
+        owners = np.flatnonzero(found)
+        rows = rows[found]
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        ends = np.cumsum(lengths)
+        positions = np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - lengths, lengths)
+        return self.neighbors[np.repeat(self.indptr[rows], lengths) + positions], np.repeat(owners, lengths)
+
+    def friends_of(self, user_id: int) -> Set[int]:
+        self.ensure_built()
+        with self._lock:
+            friends = set(self._csr_neighbors(np.array([user_id], dtype=np.int64))[0].tolist())
+            friends |= self._added.get(user_id, set())
+            friends -= self._removed.get(user_id, set())
+            return friends
+
+    def mutual_counts(self, user_id: int) -> Dict[int, int]:
+        """Two-hop expansion: for every friend-of-a-friend, the number of mutual friends."""
+        self.ensure_built()
+        with self._lock:
+            friends = self.friends_of(user_id)
+            if not friends:
+                return {}
+            friend_ids = np.fromiter(friends, dtype=np.int64)
+            second, owners = self._csr_neighbors(friend_ids)
+
+            # Drop CSR edges that have since been removed, then add overlay edges.
+            stale = np.zeros(len(second), dtype=bool)
+            for position, friend_id in enumerate(friend_ids.tolist()):
+                gone = self._removed.get(friend_id)
+                if gone:
+                    stale |= (owners == position) & np.isin(second, list(gone))
+            second = second[~stale]
+            extra = [other for friend_id in friends for other in self._added.get(friend_id, ())]
+            if extra:
+                second = np.concatenate([second, np.array(extra, dtype=np.int64)])
+
+        candidates, counts = np.unique(second, return_counts=True)
+        keep = ~np.isin(candidates, friend_ids) & (candidates != user_id)
+        return dict(zip(candidates[keep].tolist(), counts[keep].tolist()))
+
+
+def suggest_friends(user_id: int, limit: int) -> List[Tuple[int, int, int]]:
+    """
+    Friends-of-friends ranked by mutual friends, then shared hobbies, then id.
+    Returns ``(user_id, mutual_friends, common_hobbies)`` tuples.
+    """
+    mutual = friend_graph.mutual_counts(user_id)
+    scored = ((other_id, count, hobby_index.common_count(user_id, other_id)) for other_id, count in mutual.items())
+    return heapq.nsmallest(limit, scored, key=lambda row: (-row[1], -row[2], row[0]))
+
+
+friend_graph = FriendGraph()
@@ -0,0 +1,86 @@
+"""
+PBKDF2 password hashing on a bounded process pool.
+
+``PooledPBKDF2PasswordHasher`` produces exactly the hashes of Django's
+``PBKDF2PasswordHasher`` (same ``pbkdf2_sha256`` algorithm name, salt and
+iteration count), but runs the key derivation in a small pool of worker
+processes. Request workers then wait on the pool instead of spending
+their own CPU, and cheap endpoints keep being served during a login storm.
+
+At most ``PASSWORD_HASHING_MAX_QUEUE`` hashes may be queued or running
+per request-serving process. Beyond that, and when a hash is not finished
+within ``PASSWORD_HASHING_TIMEOUT`` seconds, ``HashingPoolSaturated`` is
+raised straight away and the views answer 503. Setting
+``PASSWORD_HASHING_WORKERS`` to 0 hashes inline, like the stock hasher.
+"""
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.encoding import force_bytes
+
+
+class HashingPoolSaturated(Exception):
+    """The hashing pool is full or too slow; the request should be shed."""
+
+
+def _pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password, salt, iterations)
+
+
+class HashingPool:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _get_executor(self, workers: int) -> ProcessPoolExecutor:
+        # Pools do not survive a fork, so each gunicorn worker starts its own.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _done(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int) -> bytes:
+        workers = getattr(settings, "PASSWORD_HASHING_WORKERS", 2)
+        if workers <= 0:
+            return _pbkdf2(password, salt, iterations)
+        with self._lock:
+            if self._in_flight >= getattr(settings, "PASSWORD_HASHING_MAX_QUEUE", 16):
+                raise HashingPoolSaturated("Too many password hashes are queued.")
+            future = self._get_executor(workers).submit(_pbkdf2, password, salt, iterations)
+            self._in_flight += 1
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=getattr(settings, "PASSWORD_HASHING_TIMEOUT", 5))
+        except TimeoutError:
+            future.cancel()
+            raise HashingPoolSaturated("Password hashing timed out.")
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2PasswordHasher with the key derivation run on ``hashing_pool``."""
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        digest = hashing_pool.pbkdf2(force_bytes(password), force_bytes(salt), iterations)
+        hash = base64.b64encode(digest).decode("ascii").strip()
+        return "%s$%d$%s$%s" % (self.algorithm, iterations, salt, hash)
+
+
+hashing_pool = HashingPool()
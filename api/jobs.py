@@ -0,0 +1,220 @@
+"""
+Database-backed background jobs.
+
+Work that does not need to finish inside the request is stored as ``Job``
+rows by ``enqueue()`` and run later by a handler registered with ``@job``:
+
+* Enqueueing inside a transaction is atomic with the change that caused
+  it, so rolled back requests leave no jobs behind.
+* A pending job is unique per (kind, key): enqueueing the same work again
+  before it ran is a no-op.
+* Due jobs of one kind are claimed together, up to the handler's
+  ``batch_size``, and the handler gets all their payloads in one call.
+* A failing batch is retried with exponential backoff, up to
+  ``JOB_MAX_ATTEMPTS`` runs; then its jobs are kept as ``failed``. Jobs left
+  ``running`` by a worker that died are claimed again after
+  ``JOB_LEASE_SECONDS``. Handlers must therefore be idempotent.
+
+Jobs run in ``manage.py runworker``, and, with ``JOB_IN_PROCESS_WORKER``, in a
+daemon thread of each process that enqueues them, so a single-process
+deployment needs neither a broker nor a separate worker. Any process may run
+any job, so jobs that fill caches only help other processes when the cache
+backend is shared. On SQLite, a request transaction that reads before it
+writes fails with "database is locked" when a job commits in between; turn
+``JOB_IN_PROCESS_WORKER`` off for write-heavy local runs. Done jobs are kept
+for ``JOB_RETENTION`` seconds for the metrics.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, router, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Handler(NamedTuple):
+    func: Callable[[List[dict]], None]
+    batch_size: int
+
+
+_handlers: Dict[str, Handler] = {}
+
+
+def job(kind: str, batch_size: int = 1):
+    """Register ``func(payloads)`` as the handler of jobs of ``kind``."""
+    def register(func):
+        _handlers[kind] = Handler(func, batch_size)
+        return func
+    return register
+
+
+def enqueue(kind: str, payloads: Dict[Optional[str], dict], delay: float = 0) -> None:
+    """
+    Queue one job of ``kind`` per key in ``payloads`` (a dict of key to payload)
+    with one insert. Keys already pending are skipped; a None key is never deduplicated.
+    """
+    if not payloads:
+        return
+    run_after = timezone.now() + timedelta(seconds=delay)
+    Job.objects.bulk_create(
+        [Job(kind=kind, key=key, payload=payload, run_after=run_after) for key, payload in payloads.items()],
+        ignore_conflicts=True,
+    )
+    if getattr(settings, "JOB_IN_PROCESS_WORKER", True):
+        transaction.on_commit(in_process_worker.wake, using=router.db_for_write(Job))
+
+
+def _due(now):
+    lease = timedelta(seconds=getattr(settings, "JOB_LEASE_SECONDS", 300))
+    return Job.objects.filter(Q(status="pending", run_after__lte=now) | Q(status="running", started_at__lt=now - lease))
+
+
+# Attempts at claiming a batch before the error is raised.
+CLAIM_ATTEMPTS = 5
+
+
+def claim():
+    """Mark the next batch of due jobs of one kind as running and return them."""
+    for attempt in range(CLAIM_ATTEMPTS):
+        try:
+            return _claim()
+        except OperationalError:
+            # On SQLite, a transaction that read cannot start writing while another
+            # connection writes ("database is locked"); it has to start over.
+            if attempt == CLAIM_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def _claim():
+    now = timezone.now()
+    db = router.db_for_write(Job)
+    with transaction.atomic(using=db):
+        due = _due(now).using(db).select_for_update(skip_locked=True).order_by("run_after", "id")
+        first = due.first()
+        if first is None:
+            return []
+        batch_size = _handlers[first.kind].batch_size if first.kind in _handlers else 1
+        jobs = list(due.filter(kind=first.kind)[:batch_size])
+        Job.objects.using(db).filter(id__in=[job_row.id for job_row in jobs]).update(
+            status="running", started_at=now, attempts=F("attempts") + 1
+        )
+    for job_row in jobs:
+        job_row.attempts += 1
+    return jobs
+
+
+def run_batch(jobs: List[Job]) -> None:
+    kind = jobs[0].kind
+    handler = _handlers.get(kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {kind!r}.")
+        handler.func([job_row.payload for job_row in jobs])
+    except Exception:
+        logger.exception("%s job(s) of kind %r failed", len(jobs), kind)
+        _retry_or_fail(jobs, traceback.format_exc())
+    else:
+        Job.objects.filter(id__in=[job_row.id for job_row in jobs]).update(status="done", finished_at=timezone.now())
+
+
+def _retry_or_fail(jobs: List[Job], error: str) -> None:
+    max_attempts = getattr(settings, "JOB_MAX_ATTEMPTS", 5)
+    backoff = getattr(settings, "JOB_RETRY_BACKOFF", 10)
+    now = timezone.now()
+    db = router.db_for_write(Job)
+    with transaction.atomic(using=db):
+        for job_row in jobs:
+            rows = Job.objects.filter(id=job_row.id)
+            if job_row.attempts >= max_attempts:
+                rows.update(status="failed", finished_at=now, last_error=error)
+                continue
+            run_after = now + timedelta(seconds=backoff * 2 ** (job_row.attempts - 1))
+            try:
+                with transaction.atomic(using=db):
+                    rows.update(status="pending", run_after=run_after, last_error=error)
+            except IntegrityError:
+                # The same job was enqueued again while this one ran (unique_pending_job); that one supersedes the retry.
+                rows.delete()
+
+
+def run_due(max_batches: Optional[int] = None) -> int:
+    """Run due batches until none are left (or ``max_batches`` ran). Returns the number of jobs run."""
+    done = batches = 0
+    while max_batches is None or batches < max_batches:
+        jobs = claim()
+        if not jobs:
+            break
+        run_batch(jobs)
+        done, batches = done + len(jobs), batches + 1
+    return done
+
+
+def prune_jobs() -> int:
+    """Delete done jobs older than JOB_RETENTION seconds. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "JOB_RETENTION", 3600))
+    return Job.objects.filter(status="done", finished_at__lt=cutoff).delete()[0]
+
+
+def job_stats() -> Dict[str, Dict]:
+    """Per kind: jobs by status, due jobs, age of the oldest pending job and mean enqueue-to-done latency."""
+    now = timezone.now()
+    stats: Dict[str, Dict] = {}
+    for row in Job.objects.values("kind", "status").annotate(count=Count("id"), oldest=Min("created_at")):
+        kind = stats.setdefault(row["kind"], {
+            "pending": 0, "running": 0, "done": 0, "failed": 0, "due": 0,
+            "oldest_pending_seconds": None, "mean_latency_seconds": None,
+        })
+        kind[row["status"]] = row["count"]
+        if row["status"] == "pending":
+            kind["oldest_pending_seconds"] = round((now - row["oldest"]).total_seconds(), 3)
+    for row in Job.objects.filter(status="pending", run_after__lte=now).values("kind").annotate(count=Count("id")):
+        stats[row["kind"]]["due"] = row["count"]
+    latency = ExpressionWrapper(F("finished_at") - F("created_at"), output_field=DurationField())
+    for row in Job.objects.filter(status="done").values("kind").annotate(latency=Avg(latency)):
+        if row["latency"] is not None:
+            stats[row["kind"]]["mean_latency_seconds"] = round(row["latency"].total_seconds(), 3)
+    return stats
+
+
+class InProcessWorker:
+    """A daemon thread that runs due jobs whenever woken, and every JOB_POLL_INTERVAL seconds."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def wake(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        pruned_at = 0.0
+        while True:
+            self._wakeup.wait(getattr(settings, "JOB_POLL_INTERVAL", 5))
+            self._wakeup.clear()
+            try:
+                run_due()
+                if time.monotonic() - pruned_at > 60:
+                    prune_jobs()
+                    pruned_at = time.monotonic()
+            except Exception:
+                logger.exception("Job worker iteration failed")
+            finally:
+                close_old_connections()
+
+
+in_process_worker = InProcessWorker()
@@ -0,0 +1,78 @@
+"""
+MinHash signatures with LSH banding over the users' hobby sets.
+
+Used by the approximate mode of ``similar_users``: instead of scoring every
+user, only the users that land in the same bucket as the viewer in at least
+one band are scored exactly. Two users collide in a band with probability
+``J ** rows`` where ``J`` is the Jaccard similarity of their hobby sets, so
+the defaults (32 bands of 2 rows) find pairs above roughly ``J = 0.18`` with
+high probability.
+"""
+import time
+from typing import Iterable
+
+import numpy as np
+
+# Mersenne prime used as the modulus of the universal hash family.
+_PRIME = (1 << 31) - 1
+# Sentinel band key for users without hobbies; never matched by a query.
+_EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class MinHashLSH:
+    """Banded MinHash index built from a ``HobbyVectors`` snapshot."""
+
+    def __init__(self, vectors, bands: int = 32, rows: int = 2, seed: int = 639) -> None:
+        self.bands = bands
+        self.rows = rows
+        self.built_at = time.monotonic()
+        self.user_ids = vectors.user_ids
+
+        rng = np.random.default_rng(seed)
+        permutations = bands * rows
+        self._a = rng.integers(1, _PRIME, size=permutations, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=permutations, dtype=np.int64)
+        self._mix = rng.integers(1, 1 << 63, size=rows, dtype=np.uint64) | np.uint64(1)
+
+        hobbies = vectors.hobby_ids[vectors.indices]
+        # reduceat needs strictly in-bounds offsets, so only rows with hobbies
+        # are reduced and the rest keep the sentinel key.
+        non_empty = vectors.sizes > 0
+        starts = vectors.indptr[:-1][non_empty]
+
+        self._sorted_keys = []
+        self._order = []
+        for band in range(bands):
+            keys = np.full(len(self.user_ids), _EMPTY, dtype=np.uint64)
+            if len(starts):
+                signature = np.minimum.reduceat(self._hash(band, hobbies), starts, axis=1)
+                keys[non_empty] = self._band_key(signature)
+            order = np.argsort(keys, kind="stable")
+            self._order.append(order)
+            self._sorted_keys.append(keys[order])
+
+    def _hash(self, band: int, hobby_ids: np.ndarray) -> np.ndarray:
+        """The ``rows`` MinHash functions of one band applied to ``hobby_ids``."""
+        a = self._a[band * self.rows:(band + 1) * self.rows, None]
+        b = self._b[band * self.rows:(band + 1) * self.rows, None]
+        return (a * (hobby_ids[None, :] % _PRIME) + b) % _PRIME
+
+    def _band_key(self, signature: np.ndarray) -> np.ndarray:
+        """Fold the ``rows`` minimums of each column into one 64-bit bucket key."""
+        return (signature.astype(np.uint64) * self._mix[:, None]).sum(axis=0, dtype=np.uint64)
+
+    def candidates(self, hobby_ids: Iterable[int]) -> np.ndarray:
+        """User ids sharing a bucket with the given hobby set in at least one band."""
+        query = np.fromiter(hobby_ids, dtype=np.int64)
+        if not len(query):
+            return np.empty(0, dtype=np.int64)
+        found = []
+        for band in range(self.bands):
+            key = self._band_key(self._hash(band, query).min(axis=1, keepdims=True))[0]
+            keys = self._sorted_keys[band]
+            low, high = np.searchsorted(keys, key, side="left"), np.searchsorted(keys, key, side="right")
+            if high > low:
+                found.append(self._order[band][low:high])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return self.user_ids[np.unique(np.concatenate(found))]
@@ -0,0 +1,209 @@
+import json
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.management.commands.benchmark_similarity import percentile
+from api.management.commands.seed import SEEDED_EMAIL_REGEX
+from api.models import CustomUser, FriendRequest
+
+# Latency statistics a regression is reported for. p99 of a few hundred requests is one or
+# two outliers, so it is only printed.
+GATED_METRICS = ("p50_ms", "p95_ms")
+
+
+def dataset_label(users):
+    for size, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if users >= size:
+            return f"{round(users / size)}{suffix}"
+    return str(users)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API hot paths in-process with the test client and report p50/p95/p99 latency and query "
+        "counts per scenario, each the median over --runs rounds through every scenario. Results are "
+        "compared with the baseline recorded for the same dataset size (10k, 100k, 1M, ...) and the command "
+        "fails when a scenario's p50 or p95 regresses past both --threshold and --min-delta-ms. "
+        "Only accounts created by `seed` are logged in as, but the friend request scenario unfriends and "
+        "befriends them, so outside SQLite the command refuses to run without --allow-writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=100, help="Measured requests per scenario and run.")
+        parser.add_argument("--runs", type=int, default=5,
+                            help="Rounds through every scenario; each statistic is the median over them.")
+        parser.add_argument("--viewers", type=int, default=20, help="Distinct logged-in users to sample from.")
+        parser.add_argument("--ensure-users", type=int, default=0,
+                            help="Run `seed` first until the database holds at least this many users.")
+        parser.add_argument("--baseline", default=str(Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline.")
+        parser.add_argument("--threshold", type=float, default=0.25,
+                            help="Allowed relative latency increase over the baseline (0.25 = 25%%).")
+        parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                            help="Latency increases smaller than this are never reported, whatever --threshold.")
+        parser.add_argument("--query-threshold", type=float, default=0,
+                            help="Allowed increase in mean queries per request over the baseline.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--allow-writes", action="store_true",
+                            help="Run against a database other than SQLite, which the command writes to.")
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        if database.vendor != "sqlite" and not options["allow_writes"]:
+            raise CommandError(
+                f"This command changes seeded users' friendships in the {database.vendor} database "
+                f"{database.settings_dict['NAME']!r}. Point it at a scratch database and pass --allow-writes."
+            )
+        users = CustomUser.objects.count()
+        if users < options["ensure_users"]:
+            # Each top-up gets its own seed, and so its own email domain.
+            call_command("seed", users=options["ensure_users"] - users, seed=1000 + users, stdout=self.stdout)
+            users = CustomUser.objects.count()
+        seeded = CustomUser.objects.filter(email__regex=SEEDED_EMAIL_REGEX)
+        seeded_ids = list(seeded.order_by("id").values_list("id", flat=True))
+        if len(seeded_ids) < 2:
+            raise CommandError("Seed the database first, e.g. manage.py seed --users 10000.")
+
+        self.rng = random.Random(options["seed"])
+        # The same viewers for every run with the same --seed, so query counts compare exactly.
+        viewer_ids = self.rng.sample(seeded_ids, min(options["viewers"], len(seeded_ids)))
+        self.clients = {}
+        for user in CustomUser.objects.filter(id__in=viewer_ids):
+            client = Client()
+            client.force_login(user)
+            self.clients[user.id] = client
+        self.viewer_ids = list(self.clients)
+
+        label = dataset_label(users)
+        self.stdout.write(f"dataset: {users} users ({label})")
+        scenarios = self.scenarios()
+        for name, scenario, prepare in scenarios:
+            for _ in range(3):
+                prepare()
+                scenario()
+        # Rounds through every scenario rather than all runs of one, so drift hits them alike.
+        runs = {name: [] for name, _, _ in scenarios}
+        for _ in range(options["runs"]):
+            for name, scenario, prepare in scenarios:
+                runs[name].append(self.measure(scenario, prepare, options["samples"]))
+        results = {}
+        for name, measured in runs.items():
+            results[name] = stats = {metric: statistics.median(run[metric] for run in measured) for metric in measured[0]}
+            self.stdout.write(
+                f"{name:>28}: p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                f"p99 {stats['p99_ms']:8.2f} ms  queries {stats['queries']:.1f}"
+            )
+
+        path = Path(options["baseline"])
+        baselines = json.loads(path.read_text()) if path.exists() else {}
+        if options["save_baseline"]:
+            baselines[label] = results
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"baseline for {label} saved to {path}")
+            return
+        if label not in baselines:
+            self.stdout.write(f"no baseline for {label} in {path}; run with --save-baseline to record one")
+            return
+
+        regressions = self.compare(
+            baselines[label], results, options["threshold"], options["min_delta_ms"], options["query_threshold"]
+        )
+        for line in regressions:
+            self.stderr.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against the {label} baseline")
+        self.stdout.write(f"no regressions against the {label} baseline")
+
+    def measure(self, scenario, prepare, samples):
+        """Time ``scenario`` and count its queries; ``prepare`` runs untimed before each call."""
+        latencies, queries = [], 0
+        for _ in range(samples):
+            prepare()
+            # Every alias, so reads routed to a replica are counted too.
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                scenario()
+                latencies.append(time.perf_counter() - started)
+            queries += sum(len(context) for context in captured)
+        return {
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries": queries / samples,
+        }
+
+    def compare(self, baseline, results, threshold, min_delta_ms, query_threshold):
+        regressions = []
+        for name, stats in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            for metric in GATED_METRICS:
+                if metric not in before:
+                    continue
+                if stats[metric] - before[metric] > max(before[metric] * threshold, min_delta_ms):
+                    regressions.append(f"{name}: {metric} {before[metric]:.2f} -> {stats[metric]:.2f}")
+            if stats["queries"] > before["queries"] + query_threshold:
+                regressions.append(f"{name}: queries {before['queries']:.1f} -> {stats['queries']:.1f}")
+        return regressions
+
+    def get(self, path, **params):
+        headers = {key: params.pop(key) for key in list(params) if key.startswith("HTTP_")}
+        viewer = self.rng.choice(self.viewer_ids)
+        response = self.clients[viewer].get(path, params, **headers)
+        if response.status_code not in (200, 304):
+            raise CommandError(f"GET {path} returned {response.status_code}")
+        return response
+
+    def scenarios(self):
+        """(name, timed call, untimed preparation) triples."""
+        def nothing():
+            pass
+
+        def fetch_etag():
+            self.etag = self.get("/hobbies/")["ETag"]
+
+        return [
+            ("similar_users", lambda: self.get("/similar_users/", page=1), nothing),
+            ("similar_users_uncached", lambda: self.get("/similar_users/", page=1), cache.clear),
+            ("similar_users_jaccard", lambda: self.get("/similar_users/", page=2, score="jaccard"), nothing),
+            ("similar_users_cursor", lambda: self.get("/similar_users/", cursor=""), nothing),
+            ("profile_api", lambda: self.get("/profile/"), nothing),
+            ("hobbies_api", lambda: self.get("/hobbies/"), nothing),
+            ("hobbies_api_304", lambda: self.get("/hobbies/", HTTP_IF_NONE_MATCH=self.etag), fetch_etag),
+            ("list_friends", lambda: self.get("/friends/"), nothing),
+            ("list_received_requests", lambda: self.get("/friend_requests/received/"), nothing),
+            ("list_sent_requests", lambda: self.get("/friend_requests/sent/"), nothing),
+            ("bootstrap", lambda: self.get("/bootstrap/"), nothing),
+            ("friend_request_send_accept", self.send_and_accept, self.pick_strangers),
+        ]
+
+    def pick_strangers(self):
+        """Pick two viewers, all seeded users, and undo any friendship or pending request between them."""
+        sender_id, recipient_id = self.rng.sample(self.viewer_ids, 2)
+        users = CustomUser.objects.in_bulk([sender_id, recipient_id])
+        users[sender_id].remove_friend(users[recipient_id])
+        FriendRequest.objects.filter(from_user_id=sender_id, to_user_id=recipient_id, status="pending").delete()
+        self.pair = (sender_id, recipient_id)
+
+    def send_and_accept(self):
+        """Send a request and accept it, plus the one query that looks up the new request's id."""
+        sender_id, recipient_id = self.pair
+        self.clients[sender_id].post(f"/friend_requests/send/{recipient_id}/")
+        request_id = FriendRequest.objects.filter(
+            from_user_id=sender_id, to_user_id=recipient_id, status="pending"
+        ).values_list("id", flat=True).first()
+        self.clients[recipient_id].post(f"/friend_requests/accept/{request_id}/")
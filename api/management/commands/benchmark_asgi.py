@@ -0,0 +1,125 @@
+import asyncio
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import path
+
+from api import async_views, views
+from api.management.commands.benchmark_similarity import percentile
+from api.models import CustomUser
+
+# (path, view name) of the endpoints that have an async version.
+ENDPOINTS = (
+    ("profile/", "profile_api"),
+    ("hobbies/", "hobbies_api"),
+    ("friends/", "list_friends"),
+    ("friend_requests/sent/", "list_sent_requests"),
+    ("friend_requests/received/", "list_received_requests"),
+    ("similar_users/", "similar_users"),
+)
+
+
+def urlconf(view_module):
+    module = types.ModuleType(f"benchmark_urls_{view_module.__name__}")
+    module.urlpatterns = [path(route, getattr(view_module, name)) for route, name in ENDPOINTS]
+    return module
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the read-heavy endpoints to many slow clients, each taking --delay seconds to send its "
+        "request and again to read the response. Compares WSGI-style sync workers, ASGI with the sync "
+        "views and ASGI with the native async views."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=100, help="Concurrent clients.")
+        parser.add_argument("--requests", type=int, default=3, help="Requests per client.")
+        parser.add_argument("--delay", type=float, default=0.05, help="Seconds each client takes to send and to receive.")
+        parser.add_argument("--wsgi-workers", type=int, default=4, help="Sync workers in the WSGI baseline.")
+        parser.add_argument("--email", help="User to log in as; defaults to the first user.")
+
+    def handle(self, *args, **options):
+        user = (CustomUser.objects.filter(email=options["email"]) if options["email"] else CustomUser.objects).first()
+        if user is None:
+            raise CommandError("No user to log in as; seed the database first.")
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        paths = [f"/{route}" for route, _ in ENDPOINTS]
+        total = options["clients"] * options["requests"]
+
+        with override_settings(ROOT_URLCONF=urlconf(views)):
+            self.report("wsgi", total, *self.run_wsgi(paths, cookie, options))
+        for label, view_module in (("asgi+sync", views), ("asgi+async", async_views)):
+            with override_settings(ROOT_URLCONF=urlconf(view_module)):
+                self.report(label, total, *asyncio.run(self.run_asgi(paths, cookie, options)))
+
+    def report(self, label, total, elapsed, latencies, errors):
+        self.stdout.write(
+            f"{label:>10}: {total / elapsed:.1f} req/s, p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, errors {errors}"
+        )
+
+    def run_wsgi(self, paths, cookie, options):
+        """Each slow client holds one of --wsgi-workers sync workers for the whole exchange."""
+        delay = options["delay"]
+
+        def exchange(number):
+            started = time.perf_counter()
+            time.sleep(delay)
+            response = Client(HTTP_COOKIE=cookie).get(paths[number % len(paths)])
+            time.sleep(delay)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["wsgi_workers"]) as workers:
+            results = list(workers.map(exchange, range(options["clients"] * options["requests"])))
+        return time.perf_counter() - started, [latency for latency, _ in results], sum(s != 200 for _, s in results)
+
+    async def run_asgi(self, paths, cookie, options):
+        application = get_asgi_application()
+        delay = options["delay"]
+        latencies, statuses = [], []
+
+        async def exchange(path):
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+                "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+                "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+            }
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    await asyncio.sleep(delay)
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # The client never disconnects; the handler cancels this wait when it is done.
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+                elif not message.get("more_body"):
+                    await asyncio.sleep(delay)
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            latencies.append(time.perf_counter() - started)
+
+        async def client(number):
+            for request in range(options["requests"]):
+                await exchange(paths[(number + request) % len(paths)])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(number) for number in range(options["clients"])))
+        return time.perf_counter() - started, latencies, sum(status != 200 for status in statuses)
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api.hashers import HashingPoolSaturated, PooledPBKDF2PasswordHasher, hashing_pool
+from api.management.commands.benchmark_similarity import percentile
+
+
+class Command(BaseCommand):
+    help = "Compare login throughput (password verification) with inline and pooled PBKDF2 hashing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200, help="Number of password checks per mode.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent request threads.")
+        parser.add_argument("--workers", type=int, default=2, help="Hashing pool size for the pooled run.")
+        parser.add_argument("--iterations", type=int, default=None,
+                            help="PBKDF2 iterations; defaults to Django's current count.")
+
+    def handle(self, *args, **options):
+        hasher = PooledPBKDF2PasswordHasher()
+        iterations = options["iterations"] or hasher.iterations
+        with override_settings(PASSWORD_HASHING_WORKERS=0):
+            encoded = hasher.encode("benchmark-password", hasher.salt(), iterations)
+
+        for label, workers in (("inline", 0), ("pooled", options["workers"])):
+            with override_settings(PASSWORD_HASHING_WORKERS=workers):
+                if workers:
+                    # Start the pool outside the timed run.
+                    hasher.encode("warm-up", hasher.salt(), 1)
+                latencies, shed = [], 0
+
+                def login(_):
+                    started = time.perf_counter()
+                    try:
+                        hasher.verify("benchmark-password", encoded)
+                    except HashingPoolSaturated:
+                        return None
+                    return time.perf_counter() - started
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options["concurrency"]) as threads:
+                    for latency in threads.map(login, range(options["logins"])):
+                        if latency is None:
+                            shed += 1
+                        else:
+                            latencies.append(latency)
+                elapsed = time.perf_counter() - started
+
+            line = f"{label:>6}: {len(latencies) / elapsed:.1f} logins/s, shed {shed}"
+            if latencies:
+                line += f", p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+            self.stdout.write(line)
+        self.stdout.write(f"pool in flight after run: {hashing_pool.in_flight}")
@@ -0,0 +1,59 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.similarity import SCORING_MODES, hobby_index, rank_similar_users
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Compare recall and latency of the approximate (MinHash/LSH) similar_users ranking against the exact one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=200, help="Number of viewers to rank for.")
+        parser.add_argument("--k", type=int, default=9, help="Size of the top-k compared (one page by default).")
+        parser.add_argument("--score", choices=SCORING_MODES, default="overlap")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        hobby_index.ensure_built()
+        built = time.perf_counter()
+        hobby_index.lsh()
+        banded = time.perf_counter()
+        self.stdout.write(f"index build: {(built - started) * 1000:.0f} ms, LSH build: {(banded - built) * 1000:.0f} ms")
+
+        vectors = hobby_index.vectors()
+        viewers = vectors.user_ids[vectors.sizes > 0].tolist()
+        if not viewers:
+            raise CommandError("No users with hobbies to benchmark; seed the database first.")
+        viewers = random.Random(options["seed"]).sample(viewers, min(options["samples"], len(viewers)))
+
+        k, mode = options["k"], options["score"]
+        exact_times, approx_times, recalls = [], [], []
+        for user_id in viewers:
+            t0 = time.perf_counter()
+            exact = rank_similar_users(user_id, k, mode=mode)
+            t1 = time.perf_counter()
+            approx = rank_similar_users(user_id, k, mode=mode, approximate=True)
+            t2 = time.perf_counter()
+            exact_times.append(t1 - t0)
+            approx_times.append(t2 - t1)
+
+            # Only rows that actually share a hobby count towards recall.
+            relevant = {other_id for other_id, common, _ in exact if common}
+            if relevant:
+                found = {other_id for other_id, _, score in approx if score}
+                recalls.append(len(relevant & found) / len(relevant))
+
+        for label, times in (("exact", exact_times), ("approx", approx_times)):
+            self.stdout.write(
+                f"{label:>6}: p50 {percentile(times, 0.5) * 1000:.2f} ms, p99 {percentile(times, 0.99) * 1000:.2f} ms"
+            )
+        if recalls:
+            self.stdout.write(f"recall@{k} ({mode}): {sum(recalls) / len(recalls):.3f} over {len(recalls)} viewers")
@@ -0,0 +1,11 @@
+from django.core.management.commands import migrate
+
+from project.database import disable_statement_timeout
+
+
+class Command(migrate.Command):
+    """Django's migrate, without DATABASE_STATEMENT_TIMEOUT: rewriting a large table outlasts it."""
+
+    def handle(self, *args, **options):
+        disable_statement_timeout()
+        return super().handle(*args, **options)
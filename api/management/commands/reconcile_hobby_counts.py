@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Hobby
+from api.trending import prune_trends
+from project.database import disable_statement_timeout
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the members of every hobby in batches and fix the member counts that drifted, then "
+        "delete the trending buckets that have left the window. Safe to run while the site is up: "
+        "each batch locks only its own hobby rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        disable_statement_timeout()
+        checked = fixed = last = 0
+        while True:
+            ids = list(Hobby.objects.filter(pk__gt=last).order_by("pk").values_list("pk", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            drifted = Hobby.objects.reconcile_member_counts(ids)
+            for hobby_id, (stored, actual) in drifted.items():
+                self.stdout.write(f"hobby {hobby_id}: {stored} -> {actual}")
+            checked, fixed, last = checked + len(ids), fixed + len(drifted), ids[-1]
+        self.stdout.write(f"checked {checked} hobbies, fixed {fixed}")
+        self.stdout.write(f"deleted {prune_trends()} expired trending buckets")
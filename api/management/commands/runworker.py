@@ -0,0 +1,46 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import prune_jobs, run_due
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (api.jobs) until interrupted. Several workers can run side by side; "
+        "each claims its own batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run the jobs that are due, then exit.")
+        parser.add_argument("--poll-interval", type=float, default=None,
+                            help="Seconds to sleep when no job is due (default: JOB_POLL_INTERVAL).")
+
+    def handle(self, *args, **options):
+        poll_interval = options["poll_interval"] or getattr(settings, "JOB_POLL_INTERVAL", 5)
+        pruned_at = 0.0
+        while True:
+            done = 0
+            try:
+                done = run_due()
+                if done:
+                    self.stdout.write(f"ran {done} job(s)")
+                if time.monotonic() - pruned_at > 60:
+                    prune_jobs()
+                    pruned_at = time.monotonic()
+            except Exception:
+                if options["once"]:
+                    raise
+                # A lost database connection or a failing prune must not stop the worker.
+                logger.exception("Job worker iteration failed")
+            finally:
+                close_old_connections()
+            if options["once"]:
+                return
+            if not done:
+                time.sleep(poll_interval)
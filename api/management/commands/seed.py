@@ -0,0 +1,169 @@
+import random
+import re
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Greatest, Least
+from faker import Faker
+
+from api import cache as result_cache
+from api.models import CustomUser, FriendRequest, Friendship, Hobby
+from project.database import disable_statement_timeout
+
+HOBBIES = [
+    "Reading", "Hiking", "Cooking", "Photography", "Gardening", "Painting", "Running", "Cycling", "Swimming",
+    "Chess", "Yoga", "Fishing", "Knitting", "Gaming", "Dancing", "Singing", "Guitar", "Piano", "Drawing",
+    "Writing", "Baking", "Camping", "Climbing", "Football", "Basketball", "Tennis", "Golf", "Skiing",
+    "Surfing", "Skateboarding", "Woodworking", "Pottery", "Birdwatching", "Astronomy", "Origami",
+    "Calligraphy", "Board Games", "Volunteering", "Traveling", "Film", "Podcasts", "Meditation",
+    "Martial Arts", "Boxing", "Rowing", "Sailing", "Kayaking", "Archery", "Bouldering", "Crossword Puzzles",
+    "Sudoku", "Embroidery", "Sewing", "Coding", "Robotics", "Languages", "Poetry", "Stand-up Comedy",
+    "Theatre", "Karaoke", "Wine Tasting", "Coffee Roasting", "Home Brewing", "Baking Bread", "Scrapbooking",
+]
+
+# Matches the email of every user created by this command, whatever its --seed.
+SEEDED_EMAIL_REGEX = r"@seed[0-9]+\.example\.com$"
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate a synthetic dataset: users with Zipf-distributed hobbies, friendships and pending "
+        "friend requests, inserted in chunks. Every user's password is --password, hashed once. "
+        "New hobbies are created through Hobby.objects.get_or_create_many, which sends post_save for "
+        "each, so they become searchable. Everything else is inserted without signals: hobby member "
+        "counts are recounted at the end, and other running processes pick the users and friendships up "
+        "when their in-memory indexes next rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--hobbies", type=int, default=500, help="Size of the hobby catalogue to draw from.")
+        parser.add_argument("--max-hobbies", type=int, default=8, help="Most hobbies per user (at least 1).")
+        parser.add_argument("--zipf", type=float, default=1.1, help="Exponent of the hobby popularity distribution.")
+        parser.add_argument("--friends", type=int, default=10, help="Average friends per user.")
+        parser.add_argument("--requests", type=int, default=2, help="Average pending requests sent per user.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        disable_statement_timeout()
+        self.rng = random.Random(options["seed"])
+        self.fake = Faker()
+        self.fake.seed_instance(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        domain = f"seed{options['seed']}.example.com"
+        if CustomUser.objects.filter(email__endswith=f"@{domain}").exists():
+            raise CommandError(f"Users from seed {options['seed']} already exist; pick another --seed.")
+
+        started = time.perf_counter()
+        hobby_ids, cum_weights = self.seed_hobbies(options["hobbies"], options["zipf"])
+        self.phase("hobbies", started, len(hobby_ids))
+
+        started = time.perf_counter()
+        user_ids = self.seed_users(options, domain, hobby_ids, cum_weights)
+        Hobby.objects.reconcile_member_counts(hobby_ids)
+        self.phase("users and their hobbies", started, len(user_ids))
+
+        started = time.perf_counter()
+        edges = self.seed_friendships(user_ids, options["friends"], domain)
+        self.phase("friendships", started, edges)
+
+        started = time.perf_counter()
+        requests = self.seed_requests(user_ids, options["requests"], domain)
+        self.phase("pending friend requests", started, requests)
+
+        # Only this process' caches are reachable from here; shared backends are evicted for everyone.
+        result_cache.invalidate_all()
+        result_cache.invalidate_all_user_snapshots()
+        result_cache.bump_catalogue_version()
+
+    def phase(self, label, started, count):
+        self.stdout.write(f"{label}: {count} in {time.perf_counter() - started:.1f}s")
+
+    def seed_hobbies(self, count, exponent):
+        names = HOBBIES[:count]
+        while len(names) < count:
+            names.append(f"{self.fake.unique.word().title()} {self.rng.choice(HOBBIES)}")
+        hobbies = Hobby.objects.get_or_create_many(names)
+        # Popularity falls off as 1 / rank ** exponent, in catalogue order.
+        weights = [1 / (rank ** exponent) for rank in range(1, len(hobbies) + 1)]
+        return [hobby.id for hobby in hobbies], list(accumulate(weights))
+
+    def seed_users(self, options, domain, hobby_ids, cum_weights):
+        password = make_password(options["password"])
+        through = CustomUser.hobbies.through
+        earliest, span = date(1950, 1, 1), (date(2007, 12, 31) - date(1950, 1, 1)).days
+        # Calling Faker per user dominates at a million users, so names are drawn from seeded pools.
+        first_names = [self.fake.first_name() for _ in range(2000)]
+        last_names = [self.fake.last_name() for _ in range(2000)]
+        user_ids = []
+        for start in range(0, options["users"], self.chunk_size):
+            stop = min(start + self.chunk_size, options["users"])
+            users = []
+            for number in range(start, stop):
+                first, last = self.rng.choice(first_names), self.rng.choice(last_names)
+                users.append(CustomUser(
+                    email=re.sub(r"[^a-z0-9.]", "", f"{first}.{last}.{number}".lower()) + f"@{domain}",
+                    name=f"{first} {last}",
+                    password=password,
+                    date_of_birth=earliest + timedelta(days=self.rng.randrange(span)) if self.rng.random() > 0.1 else None,
+                ))
+            with transaction.atomic():
+                created = CustomUser.objects.bulk_create(users)
+                if any(user.pk is None for user in created):
+                    emails = [user.email for user in users]
+                    by_email = dict(CustomUser.objects.filter(email__in=emails).values_list("email", "id"))
+                    ids = [by_email[email] for email in emails]
+                else:
+                    ids = [user.pk for user in created]
+                links = []
+                for user_id in ids:
+                    drawn = self.rng.choices(hobby_ids, cum_weights=cum_weights, k=self.rng.randint(1, options["max_hobbies"]))
+                    links += [through(customuser_id=user_id, hobby_id=hobby_id) for hobby_id in set(drawn)]
+                through.objects.bulk_create(links, batch_size=self.chunk_size)
+            user_ids += ids
+        return user_ids
+
+    def seed_friendships(self, user_ids, average, domain):
+        # Each user draws about average / 2 partners, as every edge counts for both ends.
+        # Repeats across chunks are dropped by the unique constraint.
+        if len(user_ids) < 2:
+            return 0
+        for start in range(0, len(user_ids), self.chunk_size):
+            pairs = set()
+            for user_id in user_ids[start:start + self.chunk_size]:
+                for _ in range(self.rng.randint(0, average)):
+                    other = self.rng.choice(user_ids)
+                    if other != user_id:
+                        pairs.add((min(user_id, other), max(user_id, other)))
+            with transaction.atomic():
+                Friendship.objects.bulk_create(
+                    [Friendship(low_id=low, high_id=high) for low, high in pairs],
+                    batch_size=self.chunk_size, ignore_conflicts=True,
+                )
+        return Friendship.objects.filter(low__email__endswith=f"@{domain}").count()
+
+    def seed_requests(self, user_ids, average, domain):
+        if len(user_ids) < 2:
+            return 0
+        for start in range(0, len(user_ids), self.chunk_size):
+            requests = []
+            for user_id in user_ids[start:start + self.chunk_size]:
+                targets = {self.rng.choice(user_ids) for _ in range(self.rng.randint(0, 2 * average))}
+                requests += [FriendRequest(from_user_id=user_id, to_user_id=other) for other in targets if other != user_id]
+            with transaction.atomic():
+                FriendRequest.objects.bulk_create(requests, batch_size=self.chunk_size)
+
+        # Drop the requests that landed between users who are already friends.
+        seeded = FriendRequest.objects.filter(from_user__email__endswith=f"@{domain}", status="pending")
+        seeded.filter(Exists(Friendship.objects.filter(
+            low_id=Least(OuterRef("from_user_id"), OuterRef("to_user_id")),
+            high_id=Greatest(OuterRef("from_user_id"), OuterRef("to_user_id")),
+        ))).delete()
+        return seeded.count()
@@ -0,0 +1,218 @@
+"""
+Per-route request metrics, exposed in Prometheus text format at ``/metrics``.
+
+``MetricsMiddleware`` records, for every request, its latency into a
+histogram keyed by route and method, plus the number of SQL queries it ran
+and the time spent in them. Each thread writes only to its own shard, so the
+hot path takes no locks; ``/metrics`` sums the shards when it is scraped.
+
+Queries are counted by a wrapper installed on every database connection,
+which adds to the counter of the current request held in a context
+variable. Context variables follow ``sync_to_async``, so queries that async
+views run on executor threads are attributed too.
+
+Figures are per worker process: every gunicorn worker keeps its own shards,
+and a scrape only sees the worker that served it. Methods outside ``METHODS``
+are recorded as ``OTHER``, so clients cannot grow the label set. Only staff
+users and requests bearing ``METRICS_TOKEN`` may scrape; the peer address is
+not trusted, as behind a local proxy every request comes from 127.0.0.1.
+
+Overhead budget: under 20 microseconds per request plus about 1
+microsecond per SQL query (two ``perf_counter`` calls and a few dict and list
+updates). Anything above that is a regression in this module.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds, in seconds, of the latency histogram buckets (+Inf is implied).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Methods recorded under their own label; any other is recorded as OTHER.
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+
+class RouteStats:
+    __slots__ = ("buckets", "count", "total", "queries", "query_time")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, str], RouteStats]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple[str, str], RouteStats]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Only taken once per thread, never on the request path after that.
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, route: str, method: str, duration: float, queries: int, query_time: float) -> None:
+        shard = self._shard()
+        stats = shard.get((route, method))
+        if stats is None:
+            stats = shard[(route, method)] = RouteStats()
+        stats.buckets[bisect_left(BUCKETS, duration)] += 1
+        stats.count += 1
+        stats.total += duration
+        stats.queries += queries
+        stats.query_time += query_time
+
+    def snapshot(self) -> Dict[Tuple[str, str], RouteStats]:
+        merged: Dict[Tuple[str, str], RouteStats] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, stats in list(shard.items()):
+                total = merged.setdefault(key, RouteStats())
+                total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+                total.count += stats.count
+                total.total += stats.total
+                total.queries += stats.queries
+                total.query_time += stats.query_time
+        return merged
+
+    def render(self) -> str:
+        """The merged metrics in Prometheus text exposition format."""
+        snapshot = sorted(self.snapshot().items())
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (route, method), stats in snapshot:
+            labels = f'route="{_escape(route)}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        lines += ["# HELP db_queries_total SQL queries run by route.", "# TYPE db_queries_total counter"]
+        for (route, method), stats in snapshot:
+            lines.append(f'db_queries_total{{route="{_escape(route)}",method="{method}"}} {stats.queries}')
+
+        lines += [
+            "# HELP db_query_duration_seconds_total Time spent in SQL queries by route.",
+            "# TYPE db_query_duration_seconds_total counter",
+        ]
+        for (route, method), stats in snapshot:
+            lines.append(f'db_query_duration_seconds_total{{route="{_escape(route)}",method="{method}"}} {stats.query_time}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _QueryCounter:
+    __slots__ = ("count", "time")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.time = 0.0
+
+
+_current: ContextVar[Optional[_QueryCounter]] = ContextVar("metrics_query_counter", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _current.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.time += time.perf_counter() - start
+        counter.count += 1
+
+
+def _install(connection) -> None:
+    # Innermost, so the pops of execute_wrapper() blocks still remove their own wrapper.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_install_on_connect)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self) -> Tuple[_QueryCounter, object, float]:
+        counter = _QueryCounter()
+        return counter, _current.set(counter), time.perf_counter()
+
+    def _finish(self, request, counter: _QueryCounter, token, start: float) -> None:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "<unmatched>"
+        method = request.method if request.method in METHODS else "OTHER"
+        registry.record(route, method, duration, counter.count, counter.time)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        counter, token, start = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, counter, token, start)
+
+    async def __acall__(self, request):
+        counter, token, start = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, counter, token, start)
+
+
+def _bears_token(request) -> bool:
+    token = getattr(settings, "METRICS_TOKEN", "")
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return bool(token) and scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics(request):
+    user = getattr(request, "user", None)
+    if not (user is not None and user.is_staff) and not _bears_token(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,47 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .hashers import HashingPoolSaturated
+from .views import hashing_unavailable
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also run in an async middleware chain. The stock
+    middleware is sync only, which under ASGI would push every async view
+    behind it back onto a worker thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class HashingPoolSaturatedMiddleware(MiddlewareMixin):
+    """
+    Answers 503 with Retry-After when a password hash is shed in a view that
+    does not handle HashingPoolSaturated itself, such as the admin login.
+    """
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingPoolSaturated):
+            return hashing_unavailable()
+        return None
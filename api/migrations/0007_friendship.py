@@ -0,0 +1,90 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def collapse_friendships(apps, schema_editor):
+    """Store each pair of doubled CustomUser.friends rows as one ordered edge."""
+    CustomUser = apps.get_model("api", "CustomUser")
+    Friendship = apps.get_model("api", "Friendship")
+    through = CustomUser.friends.through
+    pairs = {
+        (min(from_id, to_id), max(from_id, to_id))
+        for from_id, to_id in through.objects.values_list("from_customuser_id", "to_customuser_id").iterator()
+        if from_id != to_id
+    }
+    Friendship.objects.bulk_create(
+        [Friendship(low_id=low, high_id=high) for low, high in pairs], batch_size=5000, ignore_conflicts=True
+    )
+
+
+def expand_friendships(apps, schema_editor):
+    CustomUser = apps.get_model("api", "CustomUser")
+    Friendship = apps.get_model("api", "Friendship")
+    through = CustomUser.friends.through
+    rows = []
+    for low, high in Friendship.objects.values_list("low_id", "high_id").iterator():
+        rows.append(through(from_customuser_id=low, to_customuser_id=high))
+        rows.append(through(from_customuser_id=high, to_customuser_id=low))
+    through.objects.bulk_create(rows, batch_size=5000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_customuser_friends_friendrequest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Friendship",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "high",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "low",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["high", "low"], name="friendship_high_low")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("low", "high"), name="unique_friendship"
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(("low__lt", models.F("high"))),
+                        name="friendship_low_lt_high",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(collapse_friendships, expand_friendships),
+        migrations.RemoveField(
+            model_name="customuser",
+            name="friends",
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_members(apps, schema_editor):
+    """Fill member_count from the through table with one UPDATE."""
+    Hobby = apps.get_model("api", "Hobby")
+    through = apps.get_model("api", "CustomUser").hobbies.through
+    members = through.objects.filter(hobby_id=OuterRef("pk")).values("hobby_id").annotate(members=Count("*")).values("members")
+    Hobby.objects.update(member_count=Coalesce(Subquery(members), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_friendship'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HobbyTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('adds', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='hobby',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_members, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='hobby',
+            index=models.Index(fields=['-member_count'], name='hobby_member_count'),
+        ),
+        migrations.AddField(
+            model_name='hobbytrend',
+            name='hobby',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.hobby'),
+        ),
+        migrations.AddIndex(
+            model_name='hobbytrend',
+            index=models.Index(fields=['bucket'], name='hobby_trend_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='hobbytrend',
+            constraint=models.UniqueConstraint(fields=('hobby', 'bucket'), name='unique_hobby_trend'),
+        ),
+    ]
@@ -1,8 +1,79 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.utils import timezone
+
+class HobbyManager(models.Manager):
+    def get_or_create_many(self, names):
+        """
+        Resolve hobby names to Hobby rows in a constant number of queries,
+        creating the missing ones with a single conflict-tolerant bulk insert.
+        post_save is sent, with created=True, for every name that was missing,
+        including any a concurrent request inserted first.
+        """
+        names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+        for name in names:
+            if len(name) < 2:
+                raise ValueError("Hobby must be at least two characters long.")
+
+        hobbies = {hobby.name: hobby for hobby in self.filter(name__in=names)}
+        missing = [name for name in names if name not in hobbies]
+        if missing:
+            # bulk_create skips save() and post_save, so send the signal for the rows we created.
+            self.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            for hobby in self.filter(name__in=missing):
+                hobbies[hobby.name] = hobby
+                post_save.send(sender=self.model, instance=hobby, created=True, update_fields=None, raw=False, using=self.db)
+        return [hobbies[name] for name in names if name in hobbies]
+
+    def adjust_member_counts(self, deltas):
+        """Add ``deltas`` (hobby id to change in members) to member_count with one UPDATE."""
+        deltas = {hobby_id: delta for hobby_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        change = models.Case(
+            *(models.When(pk=hobby_id, then=models.Value(delta)) for hobby_id, delta in deltas.items()),
+            output_field=models.IntegerField(),
+        )
+        self.filter(pk__in=deltas).update(member_count=Greatest(models.F("member_count") + change, 0))
+
+    def reconcile_member_counts(self, hobby_ids):
+        """
+        Recount the members of ``hobby_ids`` and store the counts that drifted.
+        The hobby rows stay locked meanwhile, so concurrent adjustments are not lost.
+        Returns a dict of hobby id to (stored, actual) for the rows that were fixed.
+        """
+        db = self._db or router.db_for_write(self.model)
+        through = self.model.customuser_set.through
+        with transaction.atomic(using=db):
+            stored = dict(
+                self.using(db).select_for_update().filter(pk__in=hobby_ids).order_by("pk").values_list("pk", "member_count")
+            )
+            actual = dict(
+                through.objects.using(db).filter(hobby_id__in=list(stored)).values("hobby_id")
+                .annotate(members=models.Count("*")).values_list("hobby_id", "members")
+            )
+            drifted = {hobby_id: actual.get(hobby_id, 0) for hobby_id, count in stored.items() if actual.get(hobby_id, 0) != count}
+            if drifted:
+                self.using(db).filter(pk__in=drifted).update(member_count=models.Case(
+                    *(models.When(pk=hobby_id, then=models.Value(count)) for hobby_id, count in drifted.items()),
+                    output_field=models.PositiveIntegerField(),
+                ))
+        return {hobby_id: (stored[hobby_id], count) for hobby_id, count in drifted.items()}
+
 
 class Hobby(models.Model):
     name = models.CharField(max_length=255, unique=True)
+    # Users with this hobby, kept up to date by api.signals; see reconcile_hobby_counts.
+    member_count = models.PositiveIntegerField(default=0)
+
+    objects = HobbyManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-member_count"], name="hobby_member_count"),
+        ]
     
     # Prevents hobbies from being split up into single-letters.
     def save(self, *args, **kwargs):
@@ -14,6 +85,21 @@ class Hobby(models.Model):
         return self.name
 
 
+class HobbyTrend(models.Model):
+    """How many times ``hobby`` was added to a profile in the time bucket starting at ``bucket``."""
+    hobby = models.ForeignKey(Hobby, related_name="+", on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    adds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["hobby", "bucket"], name="unique_hobby_trend"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket"], name="hobby_trend_bucket"),
+        ]
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -43,7 +129,6 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=150)
     date_of_birth = models.DateField(null=True, blank=True)
     hobbies = models.ManyToManyField(Hobby, blank=True)
-    friends = models.ManyToManyField("self", blank=True, symmetrical=False, related_name="friends_set")
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
@@ -56,18 +141,76 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    def add_hobbies(self, hobbies):
+        """Attach hobbies with a single through-table insert. Meant for users with no hobbies yet."""
+        through = CustomUser.hobbies.through
+        pk_set = {hobby.pk for hobby in hobbies}
+        through.objects.bulk_create(
+            [through(customuser_id=self.pk, hobby_id=hobby_id) for hobby_id in pk_set], ignore_conflicts=True
+        )
+        m2m_changed.send(
+            sender=through, instance=self, action="post_add", reverse=False, model=Hobby, pk_set=pk_set, using=self._state.db
+        )
+
+    def friend_ids(self):
+        """
+        Ids of this user's friends, loaded once per instance. request.user is a
+        single instance for the whole request, so every friendship check in a
+        request shares this one query.
+        """
+        if getattr(self, "_friend_ids", None) is None:
+            edges = Friendship.objects.filter(models.Q(low=self) | models.Q(high=self)).values_list("low_id", "high_id")
+            self._friend_ids = {high if low == self.pk else low for low, high in edges}
+        return self._friend_ids
+
+    async def afriend_ids(self):
+        """Async version of friend_ids(), sharing its per-instance cache."""
+        if getattr(self, "_friend_ids", None) is None:
+            edges = Friendship.objects.filter(models.Q(low=self) | models.Q(high=self)).values_list("low_id", "high_id")
+            self._friend_ids = {high if low == self.pk else low async for low, high in edges}
+        return self._friend_ids
+
+    def get_friends(self):
+        """Get all friends of this user."""
+        return CustomUser.objects.filter(id__in=self.friend_ids())
+
     def add_friend(self, user):
-        """Add a user to the friends list."""
+        """Add a user to the friends list (and this user to theirs)."""
         if user != self:
-            self.friends.add(user)
+            low, high = sorted((self.pk, user.pk))
+            Friendship.objects.get_or_create(low_id=low, high_id=high)
+            for person in (self, user):
+                if getattr(person, "_friend_ids", None) is not None:
+                    person._friend_ids.add(user.pk if person is self else self.pk)
+
+    def add_friends(self, user_ids):
+        """
+        Befriend every user in ``user_ids`` with a single insert of the new edges.
+        post_save is sent for each new Friendship, as add_friend would.
+        """
+        pairs = {tuple(sorted((self.pk, user_id))) for user_id in user_ids if user_id != self.pk}
+        existing = set(Friendship.objects.filter(
+            models.Q(low=self, high_id__in=[high for _, high in pairs]) | models.Q(high=self, low_id__in=[low for low, _ in pairs])
+        ).values_list("low_id", "high_id"))
+        created = Friendship.objects.bulk_create(
+            [Friendship(low_id=low, high_id=high) for low, high in pairs - existing], ignore_conflicts=True
+        )
+        for friendship in created:
+            post_save.send(sender=Friendship, instance=friendship, created=True, update_fields=None, raw=False, using=self._state.db)
+        if getattr(self, "_friend_ids", None) is not None:
+            self._friend_ids |= {low if high == self.pk else high for low, high in pairs}
 
     def remove_friend(self, user):
-        """Remove a user from the friends list."""
-        self.friends.remove(user)
+        """Remove a user from the friends list (and this user from theirs)."""
+        low, high = sorted((self.pk, user.pk))
+        Friendship.objects.filter(low_id=low, high_id=high).delete()
+        for person in (self, user):
+            if getattr(person, "_friend_ids", None) is not None:
+                person._friend_ids.discard(user.pk if person is self else self.pk)
 
     def is_friend(self, user):
         """Check if a user is a friend."""
-        return self.friends.filter(id=user.id).exists()
+        return user.pk in self.friend_ids()
 
     def get_sent_requests(self):
         """Get all friend requests sent by this user."""
@@ -78,6 +221,25 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.received_requests.filter(status="pending")
 
 
+class Friendship(models.Model):
+    """A friendship, stored once as the ordered (low, high) pair of user ids."""
+    low = models.ForeignKey(CustomUser, related_name="+", on_delete=models.CASCADE)
+    high = models.ForeignKey(CustomUser, related_name="+", on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # Its index covers lookups from the low side; friendship_high_low covers the other side.
+            models.UniqueConstraint(fields=["low", "high"], name="unique_friendship"),
+            models.CheckConstraint(condition=models.Q(low__lt=models.F("high")), name="friendship_low_lt_high"),
+        ]
+        indexes = [
+            models.Index(fields=["high", "low"], name="friendship_high_low"),
+        ]
+
+    def __str__(self):
+        return f"Friendship between {self.low_id} and {self.high_id}"
+
+
 class FriendRequest(models.Model):
     from_user = models.ForeignKey(CustomUser, related_name="sent_requests", on_delete=models.CASCADE)
     to_user = models.ForeignKey(CustomUser, related_name="received_requests", on_delete=models.CASCADE)
@@ -92,7 +254,6 @@ class FriendRequest(models.Model):
         """Accept the friend request and establish the friendship."""
         self.status = "accepted"
         self.save()
-        self.from_user.add_friend(self.to_user)
         self.to_user.add_friend(self.from_user)
 
     def reject(self):
@@ -100,5 +261,99 @@ class FriendRequest(models.Model):
         self.status = "rejected"
         self.save()
 
+    @classmethod
+    def _set_status_many(cls, to_user, request_ids, status):
+        """
+        Move the pending requests to ``to_user`` among ``request_ids`` to ``status``
+        with one UPDATE, and send post_save for each. Returns the updated requests.
+        """
+        requests = list(
+            cls.objects.select_for_update(of=("self",)).select_related("from_user", "to_user")
+            .filter(id__in=request_ids, to_user=to_user, status="pending")
+        )
+        cls.objects.filter(id__in=[request.id for request in requests]).update(status=status)
+        for request in requests:
+            request.status = status
+            post_save.send(sender=cls, instance=request, created=False, update_fields={"status"}, raw=False, using=request._state.db)
+        return requests
+
+    @classmethod
+    def accept_many(cls, to_user, request_ids):
+        """Accept several requests at once: one UPDATE and one friendship insert."""
+        with transaction.atomic():
+            requests = cls._set_status_many(to_user, request_ids, "accepted")
+            to_user.add_friends([request.from_user_id for request in requests])
+        return requests
+
+    @classmethod
+    def reject_many(cls, to_user, request_ids):
+        """Reject several requests at once with one UPDATE."""
+        with transaction.atomic():
+            return cls._set_status_many(to_user, request_ids, "rejected")
+
+    @classmethod
+    def send_many(cls, from_user, user_ids):
+        """
+        Send requests to every user in ``user_ids`` that exists, is not ``from_user``,
+        is not already a friend and has no pending request from them.
+        Returns a dict of user id to outcome.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        existing = set(CustomUser.objects.filter(id__in=user_ids).values_list("id", flat=True))
+        friends = from_user.friend_ids()
+        pending = set(cls.objects.filter(from_user=from_user, to_user_id__in=user_ids, status="pending")
+                      .values_list("to_user_id", flat=True))
+
+        results, to_create = {}, []
+        for user_id in user_ids:
+            if user_id not in existing:
+                results[user_id] = "not_found"
+            elif user_id == from_user.id:
+                results[user_id] = "invalid"
+            elif user_id in friends:
+                results[user_id] = "already_friends"
+            elif user_id in pending:
+                results[user_id] = "already_sent"
+            else:
+                results[user_id] = "sent"
+                to_create.append(cls(from_user=from_user, to_user_id=user_id))
+
+        with transaction.atomic():
+            for request in cls.objects.bulk_create(to_create):
+                post_save.send(sender=cls, instance=request, created=True, update_fields=None, raw=False, using=request._state.db)
+        return results
+
+    def __str__(self):
+        return f"Friend Request from {self.from_user} to {self.to_user} ({self.status})"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by api.jobs. While pending, a job is unique
+    per (kind, key), so enqueueing the same work twice is a no-op.
+    """
+    kind = models.CharField(max_length=100)
+    key = models.CharField(max_length=255, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10,
+        choices=[("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")],
+        default="pending",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "key"], condition=models.Q(status="pending"), name="unique_pending_job"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after"),
+        ]
+
     def __str__(self):
-        return f"Friend Request from {self.from_user} to {self.to_user} ({self.status})"
\ No newline at end of file
+        return f"{self.kind}({self.key}) {self.status}"
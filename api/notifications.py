@@ -0,0 +1,54 @@
+"""
+Friend request events pushed to the users' WebSocket connections.
+
+Each connected user is subscribed to the channel layer group
+``user_group(user_id)`` by ``api.consumers.NotificationConsumer``. The
+signal handlers in ``api.signals`` publish on commit:
+
+* ``friend_request.received`` to the recipient of a new request,
+* ``friend_request.accepted`` / ``friend_request.rejected`` to its sender.
+
+With the default in-memory channel layer, events only reach sockets served
+by the same process as the request that caused them; several processes
+need a shared layer such as channels_redis.
+"""
+from typing import Any, Dict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def user_group(user_id: int) -> str:
+    return f"user.{user_id}"
+
+
+def notify_user(user_id: int, event: Dict[str, Any]) -> None:
+    """Send ``event`` to every open socket of ``user_id``."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    async_to_sync(layer.group_send)(user_group(user_id), {"type": "notify", "event": event})
+
+
+def friend_request_event(friend_request, created: bool) -> None:
+    if created:
+        notify_user(friend_request.to_user_id, {
+            "type": "friend_request.received",
+            "request": {
+                "id": friend_request.id,
+                "from_user_id": friend_request.from_user_id,
+                "from_user": friend_request.from_user.name,
+                "status": friend_request.status,
+                "created_at": friend_request.created_at.isoformat(),
+            },
+        })
+    elif friend_request.status in ("accepted", "rejected"):
+        notify_user(friend_request.from_user_id, {
+            "type": f"friend_request.{friend_request.status}",
+            "request": {
+                "id": friend_request.id,
+                "to_user_id": friend_request.to_user_id,
+                "to_user": friend_request.to_user.name,
+                "status": friend_request.status,
+            },
+        })
@@ -0,0 +1,90 @@
+"""
+In-memory index of hobby names for autocomplete.
+
+Names are kept as a sorted array of lower-cased keys, so prefix matches are a
+binary search plus a short scan; substring matches fall back to a linear scan
+of the keys. Matches are ranked by popularity, i.e. the number of users with
+the hobby according to the hobby index in ``api.similarity``.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Hobby
+from .similarity import hobby_index
+
+
+class HobbySearchIndex:
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._built_at: Optional[float] = None
+        self._keys: List[Tuple[str, int]] = []
+        self._names: Dict[int, str] = {}
+
+    def ensure_built(self) -> None:
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > getattr(
+                settings, "HOBBY_SEARCH_MAX_AGE", 3600
+            ):
+                # Primary, so hobbies added since the last build are never missing.
+                names = dict(Hobby.objects.using(DEFAULT_DB_ALIAS).values_list("id", "name"))
+                self._names = names
+                self._keys = sorted((name.lower(), hobby_id) for hobby_id, name in names.items())
+                self._built_at = time.monotonic()
+
+    def add(self, hobby_id: int, name: str) -> None:
+        """Insert a new hobby, or pick up a renamed one."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self.remove(hobby_id)
+            self._names[hobby_id] = name
+            insort(self._keys, (name.lower(), hobby_id))
+
+    def remove(self, hobby_id: int) -> None:
+        with self._lock:
+            if self._built_at is None or hobby_id not in self._names:
+                return
+            key = (self._names.pop(hobby_id).lower(), hobby_id)
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                self._keys.pop(position)
+
+    def search(self, query: str, limit: int) -> List[Dict]:
+        """
+        Top ``limit`` hobbies whose name starts with ``query``, then those that
+        merely contain it, each group ordered by popularity.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        self.ensure_built()
+        with self._lock:
+            keys = self._keys
+            prefixed = []
+            position = bisect_left(keys, (query, 0))
+            while position < len(keys) and keys[position][0].startswith(query):
+                prefixed.append(keys[position][1])
+                position += 1
+
+            best = self._most_popular(prefixed, limit)
+            if len(best) < limit:
+                prefixed_ids = set(prefixed)
+                containing = [
+                    hobby_id for key, hobby_id in keys if query in key and hobby_id not in prefixed_ids
+                ]
+                best += self._most_popular(containing, limit - len(best))
+            return [{"id": hobby_id, "name": self._names[hobby_id]} for hobby_id in best]
+
+    def _most_popular(self, hobby_ids: List[int], limit: int) -> List[int]:
+        return heapq.nsmallest(
+            limit, hobby_ids, key=lambda hobby_id: (-hobby_index.member_count(hobby_id), self._names[hobby_id].lower())
+        )
+
+
+hobby_search = HobbySearchIndex()
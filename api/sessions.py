@@ -0,0 +1,150 @@
+"""
+Database session backend that coalesces writes.
+
+With ``SESSION_SAVE_EVERY_REQUEST`` the stock db backend runs a SELECT and an
+UPDATE on ``django_session`` for every request. This backend keeps recently
+used sessions in a per-process LRU and treats saves in two ways:
+
+* Saves that change the session data (login, logout, ``set_expiry``) are
+  written through to the database straight away, as before.
+* Saves that would only push the expiry date forward are skipped until
+  ``SESSION_REFRESH_FRACTION`` of ``SESSION_COOKIE_AGE`` has passed since
+  the stored expiry was written. They are then queued, and the queue is
+  flushed as a single UPDATE once it holds ``SESSION_EXPIRY_BATCH_SIZE``
+  sessions or is ``SESSION_EXPIRY_FLUSH_INTERVAL`` seconds old.
+
+A cached session is trusted for ``SESSION_LOCAL_CACHE_TTL`` seconds, so a
+logout handled by another worker process takes up to that long to reach
+this one. The stored expiry lags the cookie by at most the refresh fraction
+of the cookie age, plus queued refreshes lost if the process dies.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import router
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+
+class LocalSessions:
+    """Thread-safe LRU of session key to (data, expire_date, cached_at), plus the queued expiry refreshes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[dict, datetime, float]]" = OrderedDict()
+        self._pending: Dict[str, datetime] = {}
+        self._pending_since: Optional[float] = None
+
+    def get(self, session_key: str) -> Optional[Tuple[dict, datetime]]:
+        ttl = getattr(settings, "SESSION_LOCAL_CACHE_TTL", 5)
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            data, expire_date, cached_at = entry
+            if time.monotonic() - cached_at > ttl or expire_date <= timezone.now():
+                del self._entries[session_key]
+                return None
+            self._entries.move_to_end(session_key)
+            return dict(data), expire_date
+
+    def put(self, session_key: str, data: dict, expire_date: datetime) -> None:
+        size = getattr(settings, "SESSION_LOCAL_CACHE_SIZE", 10000)
+        with self._lock:
+            self._entries[session_key] = (dict(data), expire_date, time.monotonic())
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_key: str) -> None:
+        with self._lock:
+            self._entries.pop(session_key, None)
+            self._pending.pop(session_key, None)
+
+    def touch(self, session_key: str, expire_date: datetime) -> None:
+        """Record a new expiry for a cached session and queue it for the next flush."""
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None:
+                self._entries[session_key] = (entry[0], expire_date, entry[2])
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending[session_key] = expire_date
+
+    def take_due(self, force: bool = False) -> Dict[str, datetime]:
+        """The queued refreshes, if the batch is full or old enough (or ``force``), emptying the queue."""
+        batch_size = getattr(settings, "SESSION_EXPIRY_BATCH_SIZE", 100)
+        interval = getattr(settings, "SESSION_EXPIRY_FLUSH_INTERVAL", 5)
+        with self._lock:
+            if not self._pending:
+                return {}
+            if not force and len(self._pending) < batch_size and time.monotonic() - self._pending_since < interval:
+                return {}
+            pending, self._pending = self._pending, {}
+            return pending
+
+
+class SessionStore(DBStore):
+    def load(self):
+        if self.session_key is not None:
+            cached = local_sessions.get(self.session_key)
+            if cached is not None:
+                data, self._stored_expiry = cached
+                return data
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        data = self.decode(s.session_data)
+        self._stored_expiry = s.expire_date
+        local_sessions.put(s.session_key, data, s.expire_date)
+        return data
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key is not None:
+            self._get_session()
+        stored_expiry = getattr(self, "_stored_expiry", None)
+        if must_create or self.modified or self.session_key is None or stored_expiry is None:
+            super().save(must_create=must_create)
+            if self.session_key is not None:
+                self._stored_expiry = self.get_expiry_date()
+                local_sessions.put(self.session_key, self._get_session(no_load=must_create), self._stored_expiry)
+        else:
+            expiry = self.get_expiry_date()
+            if (expiry - stored_expiry).total_seconds() >= _refresh_after():
+                local_sessions.touch(self.session_key, expiry)
+                self._stored_expiry = expiry
+        flush_expiry_refreshes()
+
+    def delete(self, session_key=None):
+        key = session_key if session_key is not None else self.session_key
+        if key is not None:
+            local_sessions.discard(key)
+        super().delete(session_key)
+
+
+def _refresh_after() -> float:
+    return settings.SESSION_COOKIE_AGE * getattr(settings, "SESSION_REFRESH_FRACTION", 0.1)
+
+
+def flush_expiry_refreshes(force: bool = False) -> None:
+    """Write the queued expiry refreshes with one UPDATE, once they are due."""
+    pending = local_sessions.take_due(force)
+    if not pending:
+        return
+    model = SessionStore.get_model_class()
+    model.objects.using(router.db_for_write(model)).filter(session_key__in=list(pending)).update(
+        expire_date=Case(
+            *(When(session_key=key, then=Value(expire_date)) for key, expire_date in pending.items()),
+            output_field=DateTimeField(),
+        )
+    )
+
+
+local_sessions = LocalSessions()
+atexit.register(lambda: flush_expiry_refreshes(force=True))
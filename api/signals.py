@@ -0,0 +1,214 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache as result_cache
+from . import tasks
+from .graph import friend_graph
+from .models import CustomUser, FriendRequest, Friendship, Hobby
+from .notifications import friend_request_event
+from .search import hobby_search
+from .similarity import hobby_index
+from .trending import record_adds
+
+
+def _on_commit(func, *args):
+    transaction.on_commit(lambda: func(*args))
+
+
+# Keep the in-memory hobby index in step with CustomUser.hobbies. Updates are
+# applied on commit so that rolled back writes never reach the index.
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def sync_hobby_index(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if action == "post_clear":
+        clear = hobby_index.clear_hobby if reverse else hobby_index.clear_user
+        _on_commit(clear, instance.pk)
+        return
+
+    update = hobby_index.add_hobbies if action == "post_add" else hobby_index.remove_hobbies
+    if reverse:
+        for user_id in pk_set:
+            _on_commit(update, user_id, [instance.pk])
+    else:
+        _on_commit(update, instance.pk, set(pk_set))
+
+
+@receiver(post_save, sender=CustomUser)
+def sync_user_in_hobby_index(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the index does not care about.
+    if update_fields is not None and "date_of_birth" not in update_fields:
+        return
+    _on_commit(hobby_index.set_user, instance.pk, instance.date_of_birth)
+
+
+@receiver(post_delete, sender=CustomUser)
+def drop_user_from_hobby_index(sender, instance, **kwargs):
+    _on_commit(hobby_index.drop_user, instance.pk)
+
+
+# Deleting a hobby cascades to the through table without sending m2m_changed.
+@receiver(post_delete, sender=Hobby)
+def drop_hobby_from_hobby_index(sender, instance, **kwargs):
+    _on_commit(hobby_index.clear_hobby, instance.pk)
+
+
+# Evict cached similar_users results. Hobby changes alter the scores seen by
+# everyone sharing any of the affected users' hobbies (Jaccard and cosine also
+# depend on set sizes), so every hobby those users hold is invalidated.
+def _invalidate_for_hobby_change(user_ids, hobby_ids):
+    touched = set(hobby_ids)
+    for user_id in user_ids:
+        touched |= hobby_index.hobbies_of(user_id)
+    result_cache.invalidate_users(user_ids)
+    result_cache.invalidate_hobbies(touched)
+
+
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def evict_similar_users_on_hobbies(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_clear":
+        _on_commit(result_cache.invalidate_all)
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            _on_commit(_invalidate_for_hobby_change, set(pk_set), [instance.pk])
+        else:
+            _on_commit(_invalidate_for_hobby_change, [instance.pk], set(pk_set))
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def evict_similar_users_on_friendship(sender, instance, **kwargs):
+    _on_commit(result_cache.invalidate_users, [instance.low_id, instance.high_id])
+
+
+@receiver(post_save, sender=FriendRequest)
+@receiver(post_delete, sender=FriendRequest)
+def evict_similar_users_on_friend_request(sender, instance, **kwargs):
+    # requestSent is only shown to the sender.
+    _on_commit(result_cache.invalidate_users, [instance.from_user_id])
+
+
+# Names, ages and the set of users appear in everyone's results.
+@receiver(post_save, sender=CustomUser)
+def evict_similar_users_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {"name", "date_of_birth"} & set(update_fields):
+        return
+    _on_commit(result_cache.invalidate_all)
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Hobby)
+def evict_similar_users_on_delete(sender, instance, **kwargs):
+    _on_commit(result_cache.invalidate_all)
+
+
+# Apply friendship changes, including FriendRequest.accept, to the friend graph
+# snapshot as overlay edges instead of rebuilding it.
+@receiver(post_save, sender=Friendship)
+def add_to_friend_graph(sender, instance, created, **kwargs):
+    if created:
+        _on_commit(friend_graph.add_friendship, instance.low_id, instance.high_id)
+
+
+@receiver(post_delete, sender=Friendship)
+def remove_from_friend_graph(sender, instance, **kwargs):
+    _on_commit(friend_graph.remove_friendship, instance.low_id, instance.high_id)
+
+
+# Hobbies created through hobbies_api, add_hobby or signup (all get_or_create)
+# become searchable as soon as they are committed.
+@receiver(post_save, sender=Hobby)
+def sync_hobby_search(sender, instance, **kwargs):
+    _on_commit(hobby_search.add, instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Hobby)
+def drop_hobby_from_search(sender, instance, **kwargs):
+    _on_commit(hobby_search.remove, instance.pk)
+
+
+@receiver(post_save, sender=Hobby)
+@receiver(post_delete, sender=Hobby)
+def bump_hobby_catalogue(sender, instance, **kwargs):
+    _on_commit(result_cache.bump_catalogue_version)
+
+
+# Evict user snapshots. Logins only touch last_login, which is not part of them.
+@receiver(post_save, sender=CustomUser)
+def evict_user_snapshot_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    _on_commit(result_cache.invalidate_user_snapshots, [instance.pk])
+
+
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def evict_user_snapshot_on_hobbies(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_clear" and reverse:
+        _on_commit(result_cache.invalidate_all_user_snapshots)
+    elif action == "post_clear":
+        _on_commit(result_cache.invalidate_user_snapshots, [instance.pk])
+    elif action in ("post_add", "post_remove"):
+        user_ids = set(pk_set) if reverse else [instance.pk]
+        _on_commit(result_cache.invalidate_user_snapshots, user_ids)
+
+
+# Hobby names are embedded in the snapshots of everyone who has them.
+@receiver(post_save, sender=Hobby)
+def evict_user_snapshots_on_hobby_rename(sender, instance, created, **kwargs):
+    if not created:
+        _on_commit(result_cache.invalidate_all_user_snapshots)
+
+
+@receiver(post_delete, sender=Hobby)
+def evict_user_snapshots_on_hobby_delete(sender, instance, **kwargs):
+    _on_commit(result_cache.invalidate_all_user_snapshots)
+
+
+# Push request received / accepted / rejected events to the users' sockets,
+# including those of the bulk paths, which send post_save themselves.
+@receiver(post_save, sender=FriendRequest)
+def push_friend_request_event(sender, instance, created, **kwargs):
+    _on_commit(friend_request_event, instance, created)
+
+
+# Keep Hobby.member_count in step with CustomUser.hobbies, in the same
+# transaction as the change. post_remove carries every id passed to remove(),
+# held or not, so the links that really go are looked up beforehand.
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def count_hobby_members(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action in ("pre_remove", "pre_clear"):
+        links = sender.objects.using(using).filter(**{"hobby_id" if reverse else "customuser_id": instance.pk})
+        if pk_set is not None:
+            links = links.filter(**{"customuser_id__in" if reverse else "hobby_id__in": pk_set})
+        if reverse:
+            instance._member_count_deltas = {instance.pk: -links.count()}
+        else:
+            instance._member_count_deltas = dict.fromkeys(links.values_list("hobby_id", flat=True), -1)
+    elif action in ("post_remove", "post_clear"):
+        Hobby.objects.db_manager(using).adjust_member_counts(vars(instance).pop("_member_count_deltas", {}))
+    elif action == "post_add":
+        adds = {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+        Hobby.objects.db_manager(using).adjust_member_counts(adds)
+        _on_commit(record_adds, adds)
+
+
+# Deleting a user cascades to the through table without sending m2m_changed.
+@receiver(pre_delete, sender=CustomUser)
+def uncount_deleted_user(sender, instance, using, **kwargs):
+    hobby_ids = CustomUser.hobbies.through.objects.using(using).filter(customuser_id=instance.pk).values_list("hobby_id", flat=True)
+    Hobby.objects.db_manager(using).adjust_member_counts(dict.fromkeys(hobby_ids, -1))
+
+
+# Recompute the affected users' similar_users page in the background once
+# their hobbies or friendships change (api.tasks).
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def queue_refresh_on_hobbies(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove") or (action == "post_clear" and not reverse):
+        tasks.queue_similar_users_refresh(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def queue_refresh_on_friendship(sender, instance, **kwargs):
+    tasks.queue_similar_users_refresh([instance.low_id, instance.high_id])
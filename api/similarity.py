@@ -0,0 +1,675 @@
+"""
+In-memory hobby index used to rank users by the hobbies they share.
+
+The index is built lazily from the database, kept up to date by the signal
+handlers in ``api.signals`` and rebuilt from scratch every
+``SIMILARITY_INDEX_MAX_AGE`` seconds so that workers which did not see a write
+eventually catch up.
+
+Only the first build of the index, its vectors and its LSH runs in the request
+that needs it. Later rebuilds run on a background thread, one at a time per
+structure, while requests keep using the previous one. The result is published
+with a single assignment, so the lock is never held while building. Changes
+that arrive while the index is rebuilt are replayed onto the new one.
+"""
+import base64
+import heapq
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .lsh import MinHashLSH
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+
+class HobbyIndex:
+    """Hobby id -> user id inverted index, plus the per-user data needed to filter it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._built_at: Optional[float] = None
+        self._postings: Dict[int, Set[int]] = {}
+        self._user_hobbies: Dict[int, Set[int]] = {}
+        self._birth_dates: Dict[int, Optional[date]] = {}
+        self._user_ids: List[int] = []
+        self._sorted_birth_dates: List[date] = []
+        self._version = 0
+        self._vectors: Optional["HobbyVectors"] = None
+        self._lsh: Optional[MinHashLSH] = None
+        # Held while the index, vectors or LSH is being built, so each has one builder at a time.
+        self._build_locks = {name: threading.Lock() for name in ("index", "vectors", "lsh")}
+        # Changes made while a build reads the database, replayed onto its result.
+        self._changes: Optional[List[Tuple[str, tuple]]] = None
+
+    @property
+    def max_age(self) -> float:
+        return getattr(settings, "SIMILARITY_INDEX_MAX_AGE", 300)
+
+    @property
+    def vectors_refresh(self) -> float:
+        return getattr(settings, "SIMILARITY_VECTORS_REFRESH", 5)
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next read."""
+        with self._lock:
+            self._built_at = None
+
+    def ensure_built(self) -> None:
+        built_at = self._built_at
+        if built_at is None:
+            with self._build_locks["index"]:
+                if self._built_at is None:
+                    self._build()
+        elif time.monotonic() - built_at > self.max_age:
+            self._rebuild_in_background("index", self._build)
+
+    def _rebuild_in_background(self, name: str, build: Callable[[], None]) -> None:
+        """Run ``build`` on a daemon thread, unless ``name`` is already being built."""
+        lock = self._build_locks[name]
+        if not lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                build()
+            except Exception:
+                logger.exception("Rebuilding the hobby index %s failed", name)
+            finally:
+                lock.release()
+                connections.close_all()
+
+        threading.Thread(target=run, name=f"hobby-index-{name}", daemon=True).start()
+
+    def _record(self, change: str, *args) -> None:
+        if self._changes is not None:
+            self._changes.append((change, args))
+
+    def _build(self) -> None:
+        with self._lock:
+            self._changes = []
+        try:
+            self._read_and_publish()
+        finally:
+            self._changes = None
+
+    def _read_and_publish(self) -> None:
+        birth_dates: Dict[int, Optional[date]] = {}
+        user_hobbies: Dict[int, Set[int]] = {}
+        postings: Dict[int, Set[int]] = {}
+
+        # Read from the primary: signals keep the index current, and a lagging replica would roll it back.
+        for user_id, date_of_birth in CustomUser.objects.using(DEFAULT_DB_ALIAS).values_list("id", "date_of_birth").iterator():
+            birth_dates[user_id] = date_of_birth
+            user_hobbies[user_id] = set()
+
+        through = CustomUser.hobbies.through.objects.using(DEFAULT_DB_ALIAS).values_list("customuser_id", "hobby_id")
+        for user_id, hobby_id in through.iterator():
+            if user_id in user_hobbies:
+                user_hobbies[user_id].add(hobby_id)
+                postings.setdefault(hobby_id, set()).add(user_id)
+
+        user_ids = sorted(birth_dates)
+        sorted_birth_dates = sorted(d for d in birth_dates.values() if d is not None)
+
+        with self._lock:
+            self._birth_dates = birth_dates
+            self._user_hobbies = user_hobbies
+            self._postings = postings
+            self._user_ids = user_ids
+            self._sorted_birth_dates = sorted_birth_dates
+            self._built_at = time.monotonic()
+            self._version += 1
+            # The reads may or may not have seen these; every change is idempotent.
+            changes, self._changes = self._changes, None
+            for change, args in changes:
+                getattr(self, change)(*args)
+
+    # Incremental updates. These are no-ops until the index has been built,
+    # since the first build reads the committed state anyway. A user's hobby
+    # set is replaced rather than changed in place, so the vectors can be
+    # built from a shallow copy of the index.
+
+    def add_hobbies(self, user_id: int, hobby_ids) -> None:
+        hobby_ids = set(hobby_ids)
+        with self._lock:
+            self._record("add_hobbies", user_id, hobby_ids)
+            if self._built_at is None or user_id not in self._user_hobbies:
+                return
+            self._version += 1
+            self._user_hobbies[user_id] = self._user_hobbies[user_id] | hobby_ids
+            for hobby_id in hobby_ids:
+                self._postings.setdefault(hobby_id, set()).add(user_id)
+
+    def remove_hobbies(self, user_id: int, hobby_ids) -> None:
+        hobby_ids = set(hobby_ids)
+        with self._lock:
+            self._record("remove_hobbies", user_id, hobby_ids)
+            if self._built_at is None or user_id not in self._user_hobbies:
+                return
+            self._version += 1
+            self._user_hobbies[user_id] = self._user_hobbies[user_id] - hobby_ids
+            for hobby_id in hobby_ids:
+                members = self._postings.get(hobby_id)
+                if members is not None:
+                    members.discard(user_id)
+                    if not members:
+                        del self._postings[hobby_id]
+
+    def clear_user(self, user_id: int) -> None:
+        with self._lock:
+            self._record("clear_user", user_id)
+            self.remove_hobbies(user_id, list(self._user_hobbies.get(user_id, ())))
+
+    def clear_hobby(self, hobby_id: int) -> None:
+        with self._lock:
+            self._record("clear_hobby", hobby_id)
+            for user_id in list(self._postings.get(hobby_id, ())):
+                self.remove_hobbies(user_id, [hobby_id])
+
+    def set_user(self, user_id: int, date_of_birth: Optional[date]) -> None:
+        """Add a new user or update the date of birth of an existing one."""
+        with self._lock:
+            self._record("set_user", user_id, date_of_birth)
+            if self._built_at is None:
+                return
+            if user_id in self._birth_dates:
+                previous = self._birth_dates[user_id]
+                if previous == date_of_birth:
+                    return
+                if previous is not None:
+                    self._sorted_birth_dates.pop(bisect_left(self._sorted_birth_dates, previous))
+            else:
+                self._user_hobbies[user_id] = set()
+                insort(self._user_ids, user_id)
+            self._birth_dates[user_id] = date_of_birth
+            self._version += 1
+            if date_of_birth is not None:
+                insort(self._sorted_birth_dates, date_of_birth)
+
+    def drop_user(self, user_id: int) -> None:
+        with self._lock:
+            self._record("drop_user", user_id)
+            if self._built_at is None or user_id not in self._birth_dates:
+                return
+            self.clear_user(user_id)
+            self._version += 1
+            date_of_birth = self._birth_dates.pop(user_id)
+            if date_of_birth is not None:
+                self._sorted_birth_dates.pop(bisect_left(self._sorted_birth_dates, date_of_birth))
+            self._user_ids.pop(bisect_left(self._user_ids, user_id))
+            del self._user_hobbies[user_id]
+
+    # Queries
+
+    def hobbies_of(self, user_id: int) -> Set[int]:
+        self.ensure_built()
+        with self._lock:
+            return set(self._user_hobbies.get(user_id, ()))
+
+    def overlap_counts(self, user_id: int) -> Counter:
+        """Count shared hobbies for every user sharing at least one with ``user_id``."""
+        self.ensure_built()
+        counts: Counter = Counter()
+        with self._lock:
+            for hobby_id in self._user_hobbies.get(user_id, ()):
+                counts.update(self._postings[hobby_id])
+        counts.pop(user_id, None)
+        return counts
+
+    def vectors(self) -> "HobbyVectors":
+        """
+        Array snapshot of the index for vectorised scoring. It is rebuilt when
+        the index has changed, at most once every ``SIMILARITY_VECTORS_REFRESH``
+        seconds.
+        """
+        self.ensure_built()
+        current = self._vectors
+        if current is None:
+            with self._build_locks["vectors"]:
+                if self._vectors is None:
+                    self._build_vectors()
+            return self._vectors
+        if current.version != self._version and time.monotonic() - current.built_at > self.vectors_refresh:
+            self._rebuild_in_background("vectors", self._build_vectors)
+        return current
+
+    def _build_vectors(self) -> None:
+        with self._lock:
+            version = self._version
+            user_hobbies, birth_dates = dict(self._user_hobbies), dict(self._birth_dates)
+        self._vectors = HobbyVectors(user_hobbies, birth_dates, version)
+
+    def lsh(self) -> MinHashLSH:
+        """
+        MinHash/LSH index over the current vectors, rebuilt at most once every
+        ``SIMILARITY_LSH_REFRESH`` seconds since banding every user is costly.
+        """
+        vectors = self.vectors()
+        current = self._lsh
+        if current is None:
+            with self._build_locks["lsh"]:
+                if self._lsh is None:
+                    self._build_lsh(vectors)
+            return self._lsh
+        if current.user_ids is not vectors.user_ids and (
+            time.monotonic() - current.built_at > getattr(settings, "SIMILARITY_LSH_REFRESH", 60)
+        ):
+            self._rebuild_in_background("lsh", lambda: self._build_lsh(vectors))
+        return current
+
+    def _build_lsh(self, vectors: "HobbyVectors") -> None:
+        self._lsh = MinHashLSH(
+            vectors,
+            bands=getattr(settings, "SIMILARITY_LSH_BANDS", 32),
+            rows=getattr(settings, "SIMILARITY_LSH_ROWS", 2),
+        )
+
+    def member_count(self, hobby_id: int) -> int:
+        """Number of users with this hobby."""
+        self.ensure_built()
+        with self._lock:
+            return len(self._postings.get(hobby_id, ()))
+
+    def common_count(self, user_id: int, other_id: int) -> int:
+        self.ensure_built()
+        with self._lock:
+            return len(self._user_hobbies.get(user_id, set()) & self._user_hobbies.get(other_id, set()))
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._birth_dates
+
+    def birth_date(self, user_id: int) -> Optional[date]:
+        return self._birth_dates.get(user_id)
+
+    def count_in_range(self, earliest: Optional[date], latest: Optional[date]) -> int:
+        """Number of users whose date of birth lies in ``[earliest, latest]``."""
+        self.ensure_built()
+        with self._lock:
+            if earliest is None and latest is None:
+                return len(self._birth_dates)
+            dates = self._sorted_birth_dates
+            low = bisect_left(dates, earliest) if earliest is not None else 0
+            high = bisect_right(dates, latest) if latest is not None else len(dates)
+            return max(high - low, 0)
+
+    def iter_user_ids(self, start_after: int = 0) -> Iterator[int]:
+        """Yield user ids in ascending order, starting after ``start_after``."""
+        self.ensure_built()
+        user_ids = self._user_ids
+        position = bisect_right(user_ids, start_after)
+        while position < len(user_ids):
+            yield user_ids[position]
+            position += 1
+
+
+class HobbyVectors:
+    """
+    Read-only array form of the hobby index.
+
+    Each user is a sparse row over the hobby id space (``indptr``/``indices``
+    in CSR layout), and each hobby has the matching posting list of rows
+    (``posting_ptr``/``posting_rows``). Scoring one user against everyone is a
+    ``bincount`` over the posting lists of their hobbies.
+    """
+
+    def __init__(self, user_hobbies: Dict[int, Set[int]], birth_dates: Dict[int, Optional[date]], version: int) -> None:
+        self.version = version
+        self.built_at = time.monotonic()
+
+        user_ids = sorted(user_hobbies)
+        n_users = len(user_ids)
+        self.user_ids = np.array(user_ids, dtype=np.int64)
+        self.sizes = np.fromiter((len(user_hobbies[u]) for u in user_ids), dtype=np.int64, count=n_users)
+        self.indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(self.sizes, out=self.indptr[1:])
+        hobbies = np.fromiter(
+            (hobby_id for u in user_ids for hobby_id in user_hobbies[u]), dtype=np.int64, count=int(self.indptr[-1])
+        )
+        self.hobby_ids, indices = np.unique(hobbies, return_inverse=True)
+        self.indices = indices.astype(np.int32)
+
+        rows = np.repeat(np.arange(n_users, dtype=np.int32), self.sizes)
+        self.posting_rows = rows[np.argsort(self.indices, kind="stable")]
+        self.posting_ptr = np.zeros(len(self.hobby_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.hobby_ids)), out=self.posting_ptr[1:])
+
+        # Proleptic ordinals, with 0 standing in for an unknown date of birth.
+        self.birth_ordinals = np.fromiter(
+            ((birth_dates[u].toordinal() if birth_dates.get(u) else 0) for u in user_ids), dtype=np.int64, count=n_users
+        )
+
+    def row_of(self, user_id: int) -> int:
+        """Row of ``user_id`` in the arrays, or -1 if it is not in this snapshot."""
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return -1
+
+    def overlap(self, hobby_ids) -> np.ndarray:
+        """Number of hobbies each row shares with ``hobby_ids``."""
+        query = np.fromiter(hobby_ids, dtype=np.int64)
+        columns = np.searchsorted(self.hobby_ids, query)
+        columns = columns[(columns < len(self.hobby_ids)) & (self.hobby_ids[np.minimum(columns, len(self.hobby_ids) - 1)] == query)]
+        if not len(columns):
+            return np.zeros(len(self.user_ids), dtype=np.int64)
+        rows = np.concatenate([self.posting_rows[self.posting_ptr[c]:self.posting_ptr[c + 1]] for c in columns])
+        return np.bincount(rows, minlength=len(self.user_ids))
+
+    def overlap_rows(self, rows: np.ndarray, hobby_ids) -> np.ndarray:
+        """Like ``overlap`` but only for the given rows, without touching the others."""
+        query = np.fromiter(hobby_ids, dtype=np.int64)
+        lengths = self.sizes[rows]
+        ends = np.cumsum(lengths)
+        positions = np.arange(int(ends[-1]) if len(ends) else 0) - np.repeat(ends - lengths, lengths)
+        columns = self.indices[np.repeat(self.indptr[rows], lengths) + positions]
+        hits = np.isin(self.hobby_ids[columns], query)
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(owners, weights=hits, minlength=len(rows)).astype(np.int64)
+
+    def age_mask(self, earliest: Optional[date], latest: Optional[date], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Vectorised ``in_range`` over every row, or over ``rows`` only."""
+        ordinals = self.birth_ordinals if rows is None else self.birth_ordinals[rows]
+        mask = np.ones(len(ordinals), dtype=bool)
+        if earliest is None and latest is None:
+            return mask
+        mask &= ordinals > 0
+        if earliest is not None:
+            mask &= ordinals >= earliest.toordinal()
+        if latest is not None:
+            mask &= ordinals <= latest.toordinal()
+        return mask
+
+
+SCORING_MODES = ("overlap", "jaccard", "cosine")
+
+
+def similarity_scores(overlap: np.ndarray, sizes: np.ndarray, query_size: int, mode: str) -> np.ndarray:
+    """Turn raw overlap counts into Jaccard or cosine similarity."""
+    overlap = overlap.astype(np.float64)
+    if mode == "jaccard":
+        return overlap / (query_size + sizes - overlap)
+    if mode == "cosine":
+        return overlap / np.sqrt(query_size * sizes)
+    return overlap
+
+
+def in_range(date_of_birth: Optional[date], earliest: Optional[date], latest: Optional[date]) -> bool:
+    """Mirror of the ``date_of_birth__gte``/``__lte`` filters, including NULL handling."""
+    if earliest is None and latest is None:
+        return True
+    if date_of_birth is None:
+        return False
+    if earliest is not None and date_of_birth < earliest:
+        return False
+    if latest is not None and date_of_birth > latest:
+        return False
+    return True
+
+
+def encode_cursor(score, user_id: int) -> str:
+    """Opaque token for the ``(score, id)`` key of the last row on a page."""
+    return base64.urlsafe_b64encode(f"{score!r}:{user_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[float, int]:
+    """Inverse of ``encode_cursor``. Raises ``ValueError`` for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        score, user_id = raw.split(":")
+        score, user_id = float(score), int(user_id)
+    # binascii.Error and UnicodeDecodeError are ValueErrors too.
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+    # nan compares false both ways and would seek past nothing, or everything.
+    if not math.isfinite(score):
+        raise ValueError("Invalid cursor.")
+    return score, user_id
+
+
+def _top_by_overlap(user_id, k, after, earliest, latest):
+    """Bounded-heap top ``k`` over the users sharing a hobby with ``user_id``."""
+    index = hobby_index
+    counts = index.overlap_counts(user_id)
+    scored = [
+        (-common, other_id)
+        for other_id, common in counts.items()
+        if in_range(index.birth_date(other_id), earliest, latest)
+    ]
+    if after is not None:
+        after_key = (-after[0], after[1])
+        scored = [key for key in scored if key > after_key]
+    top = [(other_id, -negative, -negative) for negative, other_id in heapq.nsmallest(k, scored)]
+    return top, len(scored), counts.__contains__
+
+
+def _select_top(ids, overlap, scores, k, after):
+    """Top ``k`` of the scored rows by ``(score desc, id)``, after the cursor key if any."""
+    if after is not None:
+        keep = (scores < after[0]) | ((scores == after[0]) & (ids > after[1]))
+        ids, overlap, scores = ids[keep], overlap[keep], scores[keep]
+
+    candidates = len(ids)
+    if k < candidates:
+        # Keep everything tied with the k-th best score so the id tie-break stays exact.
+        threshold = np.partition(scores, candidates - k)[candidates - k]
+        keep = scores >= threshold
+        ids, overlap, scores = ids[keep], overlap[keep], scores[keep]
+    order = np.lexsort((ids, -scores))[:k]
+    return [(int(ids[i]), int(overlap[i]), float(scores[i])) for i in order], candidates
+
+
+def _top_by_vectors(user_id, k, after, earliest, latest, mode):
+    """Vectorised top ``k`` by Jaccard or cosine similarity."""
+    index = hobby_index
+    vectors = index.vectors()
+    hobby_ids = index.hobbies_of(user_id)
+    overlap = vectors.overlap(hobby_ids)
+    own_row = vectors.row_of(user_id)
+    if own_row >= 0:
+        overlap[own_row] = 0
+
+    rows = np.flatnonzero((overlap > 0) & vectors.age_mask(earliest, latest))
+    scores = similarity_scores(overlap[rows], vectors.sizes[rows], len(hobby_ids), mode)
+    top, candidates = _select_top(vectors.user_ids[rows], overlap[rows], scores, k, after)
+
+    def is_scored(other_id):
+        row = vectors.row_of(other_id)
+        return row >= 0 and overlap[row] > 0
+
+    return top, candidates, is_scored
+
+
+def _top_by_lsh(user_id, k, after, earliest, latest, mode):
+    """Top ``k`` among the MinHash/LSH candidates only, each scored exactly."""
+    index = hobby_index
+    vectors = index.vectors()
+    hobby_ids = index.hobbies_of(user_id)
+    candidate_ids = index.lsh().candidates(hobby_ids)
+    candidate_ids = candidate_ids[candidate_ids != user_id]
+
+    # Map onto the (possibly newer) vectors snapshot used for exact scoring.
+    rows = np.searchsorted(vectors.user_ids, candidate_ids)
+    found = rows < len(vectors.user_ids)
+    found[found] = vectors.user_ids[rows[found]] == candidate_ids[found]
+    rows = rows[found]
+    rows = rows[vectors.age_mask(earliest, latest, rows)]
+    overlap = vectors.overlap_rows(rows, hobby_ids)
+    rows, overlap = rows[overlap > 0], overlap[overlap > 0]
+    scores = similarity_scores(overlap, vectors.sizes[rows], len(hobby_ids), mode)
+    top, candidates = _select_top(vectors.user_ids[rows], overlap, scores, k, after)
+
+    scored = set(vectors.user_ids[rows].tolist())
+    return top, candidates, scored.__contains__
+
+
+def rank_similar_users(
+    user_id: int,
+    limit: int,
+    offset: int = 0,
+    after: Optional[Tuple[float, int]] = None,
+    earliest: Optional[date] = None,
+    latest: Optional[date] = None,
+    mode: str = "overlap",
+    approximate: bool = False,
+) -> List[Tuple[int, int, float]]:
+    """
+    Return one page of ``(user_id, common_hobbies, score)`` ordered by score
+    (descending) then id. ``mode`` picks the score: the raw overlap count, or
+    the Jaccard or cosine similarity of the two hobby sets.
+
+    The page starts either ``offset`` rows in, or just past the ``(score, id)``
+    key given in ``after`` when paging by cursor.
+
+    Only users sharing at least one hobby are scored; the top ``offset + limit``
+    of those are picked with a bounded heap (or a partial sort for the array
+    modes). Pages that run past the scored users are filled with the remaining
+    users in id order.
+
+    With ``approximate`` only the MinHash/LSH candidates are scored. Users the
+    LSH step missed end up in the id-ordered tail, still with their real
+    ``common_hobbies`` but a score of 0.
+    """
+    if after is not None:
+        offset = 0
+    if approximate:
+        top, scored, is_scored = _top_by_lsh(user_id, offset + limit, after, earliest, latest, mode)
+    elif mode == "overlap":
+        top, scored, is_scored = _top_by_overlap(user_id, offset + limit, after, earliest, latest)
+    else:
+        top, scored, is_scored = _top_by_vectors(user_id, offset + limit, after, earliest, latest, mode)
+    page = top[offset:]
+
+    if len(page) < limit:
+        index = hobby_index
+        skip = max(offset - scored, 0)
+        start_after = after[1] if after is not None and after[0] == 0 else 0
+        for other_id in index.iter_user_ids(start_after):
+            if len(page) == limit:
+                break
+            if other_id == user_id or is_scored(other_id):
+                continue
+            if not in_range(index.birth_date(other_id), earliest, latest):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            page.append((other_id, index.common_count(user_id, other_id) if approximate else 0, 0))
+    return page
+
+
+def count_similar_users(user_id: int, earliest: Optional[date] = None, latest: Optional[date] = None) -> int:
+    """Number of other users matching the age filter, answered from the index without a COUNT query."""
+    index = hobby_index
+    total = index.count_in_range(earliest, latest)
+    if user_id in index and in_range(index.birth_date(user_id), earliest, latest):
+        total -= 1
+    return total
+
+
+# Results per similar_users page.
+PAGE_SIZE = 9
+# Largest age_min / age_max accepted; larger ones overflow the date arithmetic.
+MAX_AGE = 150
+
+
+def _int_param(params, name: str, minimum: int, maximum: Optional[int] = None) -> Optional[int]:
+    """``params[name]`` as an int within bounds, None when absent. Raises ValueError naming the parameter."""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum or (maximum is not None and number > maximum):
+        if maximum is None:
+            raise ValueError(f"{name} must be an integer of at least {minimum}")
+        raise ValueError(f"{name} must be an integer from {minimum} to {maximum}")
+    return number
+
+
+def rank_similar_users_page(user_id: int, params) -> Tuple[List[Tuple[int, int, float]], str, Dict[str, Any]]:
+    """
+    Parse the query of the similar_users view and rank the requested page.
+    Returns ``(ranked rows, scoring mode, page fields)``, the page fields being
+    the response's fields other than ``users``. Raises ValueError on bad input.
+    """
+    age_min = _int_param(params, "age_min", 0, MAX_AGE)
+    age_max = _int_param(params, "age_max", 0, MAX_AGE)
+    today = date.today()
+    latest = today - timedelta(days=age_min * 365) if age_min is not None else None
+    earliest = today - timedelta(days=age_max * 365) if age_max is not None else None
+
+    mode = params.get("score", "overlap")
+    if mode not in SCORING_MODES:
+        raise ValueError(f"score must be one of: {', '.join(SCORING_MODES)}")
+
+    # Score only MinHash/LSH candidates instead of every user sharing a hobby.
+    approximate = params.get("approx") == "1"
+
+    cursor = params.get("cursor")
+    if cursor is not None:
+        # Keyset pagination: seek past the (score, id) of the previous page's last row.
+        after = decode_cursor(cursor) if cursor else None
+        ranked = rank_similar_users(
+            user_id, PAGE_SIZE + 1, after=after, earliest=earliest, latest=latest,
+            mode=mode, approximate=approximate,
+        )
+        has_next = len(ranked) > PAGE_SIZE
+        ranked = ranked[:PAGE_SIZE]
+        last_id, _, last_score = ranked[-1] if ranked else (None, None, None)
+        page_fields = {
+            "next": encode_cursor(last_score, last_id) if has_next else None,
+            "per_page": PAGE_SIZE,
+        }
+        # Totals are opt-in when paging by cursor.
+        if params.get("total") == "1":
+            page_fields["total_count"] = count_similar_users(user_id, earliest, latest)
+    else:
+        page = _int_param(params, "page", 1) or 1
+        ranked = rank_similar_users(
+            user_id, PAGE_SIZE, offset=(page - 1) * PAGE_SIZE, earliest=earliest, latest=latest,
+            mode=mode, approximate=approximate,
+        )
+        page_fields = {
+            "total_count": count_similar_users(user_id, earliest, latest),
+            "page": page,
+            "per_page": PAGE_SIZE,
+        }
+    return ranked, mode, page_fields
+
+
+def similar_users_data(ranked, mode: str, profiles, friend_ids, sent_request_ids) -> List[Dict[str, Any]]:
+    """The ``users`` list of similar_users from the ranked rows and the viewer's friends and sent requests."""
+    today = date.today()
+    users_data = []
+    for user_id, common_hobbies, score in ranked:
+        user = profiles.get(user_id)
+        if user is None:
+            continue
+        user_data = {
+            "id": user.id,
+            "name": user.name,
+            "common_hobbies": common_hobbies,
+            "age": (today - user.date_of_birth).days // 365 if user.date_of_birth else None,
+            "isFriend": user.id in friend_ids,
+            "requestSent": user.id in sent_request_ids,
+        }
+        if mode != "overlap":
+            user_data["similarity"] = round(score, 4)
+        users_data.append(user_data)
+    return users_data
+
+
+hobby_index = HobbyIndex()
@@ -0,0 +1,147 @@
+"""
+The SPA shell (``api/spa/index.html``), pre-rendered and held in memory.
+
+The template is rendered once per process and kept as plain, gzip and (when
+the optional ``brotli`` package is installed) brotli bytes, each with its own
+ETag, and a ``Link`` header that preloads the entry's hashed JS and CSS. Those come from
+the Vite build manifest (``.vite/manifest.json`` under ``api/static/api/spa``),
+or, for builds made without one, from the script and stylesheet tags of the
+shell itself. With ``DEBUG`` on, the shell is rebuilt whenever the template
+file changes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from html.parser import HTMLParser
+from typing import Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TEMPLATE = "api/spa/index.html"
+MANIFEST = "api/spa/.vite/manifest.json"
+# The base the Vite build writes into the shell (vite.config.ts).
+ASSET_BASE = "/static/api/spa/"
+
+
+# ETag suffix of each encoding: every encoding is a representation of its own.
+ETAG_SUFFIXES = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+
+class Shell(NamedTuple):
+    bodies: Dict[str, bytes]
+    etags: Dict[str, str]
+    link: str
+    mtime: Optional[float]
+
+
+class _AssetTags(HTMLParser):
+    """Collects the module scripts and stylesheets referenced by a page."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.scripts: List[str] = []
+        self.styles: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script" and attrs.get("type") == "module" and attrs.get("src"):
+            self.scripts.append(attrs["src"])
+        elif tag == "link" and attrs.get("rel") == "stylesheet" and attrs.get("href"):
+            self.styles.append(attrs["href"])
+
+
+def _manifest_assets() -> Optional[tuple]:
+    """(scripts, stylesheets) of the manifest's entry chunks and their static imports, or None without a manifest."""
+    path = finders.find(MANIFEST)
+    if path is None:
+        return None
+    with open(path) as file:
+        manifest = json.load(file)
+    scripts, styles, seen = [], [], set()
+
+    def visit(key):
+        if key in seen or key not in manifest:
+            return
+        seen.add(key)
+        chunk = manifest[key]
+        scripts.append(ASSET_BASE + chunk["file"])
+        styles.extend(ASSET_BASE + css for css in chunk.get("css", []))
+        for imported in chunk.get("imports", []):
+            visit(imported)
+
+    for key, chunk in manifest.items():
+        if chunk.get("isEntry"):
+            visit(key)
+    return scripts, list(dict.fromkeys(styles))
+
+
+def preload_header(html: str) -> str:
+    assets = _manifest_assets()
+    if assets is None:
+        tags = _AssetTags()
+        tags.feed(html)
+        assets = tags.scripts, tags.styles
+    scripts, styles = assets
+    # crossorigin matches the build's tags, so the browser reuses the preloaded responses.
+    links = [f"<{href}>; rel=modulepreload; crossorigin" for href in scripts]
+    links += [f"<{href}>; rel=preload; as=style; crossorigin" for href in styles]
+    return ", ".join(links)
+
+
+def build_shell() -> Shell:
+    template = get_template(TEMPLATE)
+    origin = template.origin.name
+    mtime = os.path.getmtime(origin) if os.path.exists(origin) else None
+    html = template.render()
+    body = html.encode()
+    bodies = {"identity": body, "gzip": gzip.compress(body, 9)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body)
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    etags = {encoding: f'"spa-{digest}{ETAG_SUFFIXES[encoding]}"' for encoding in bodies}
+    return Shell(bodies, etags, preload_header(html), mtime)
+
+
+class SpaShellCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._shell: Optional[Shell] = None
+
+    def get(self) -> Shell:
+        shell = self._shell
+        if shell is not None and not (settings.DEBUG and self._changed(shell)):
+            return shell
+        with self._lock:
+            if self._shell is shell:
+                self._shell = build_shell()
+            return self._shell
+
+    @staticmethod
+    def _changed(shell: Shell) -> bool:
+        origin = get_template(TEMPLATE).origin.name
+        return os.path.exists(origin) and os.path.getmtime(origin) != shell.mtime
+
+
+def accepted_encoding(header: str, available) -> str:
+    """The best of brotli, gzip and identity that both sides support."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in available and encoding in accepted:
+            return encoding
+    return "identity"
+
+
+spa_shell = SpaShellCache()
@@ -0,0 +1,96 @@
+"""
+Background job handlers (see ``api.jobs``).
+
+``refresh_similar_users`` is queued by ``api.signals`` when a user's hobbies
+or friendships change: ``update_profile_api``, signup, ``FriendRequest.accept``
+and the bulk accept path. It recomputes the user's default similar_users page
+outside the request, so the next visit after the change is a cache hit.
+"""
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Q
+from django.http import QueryDict
+
+from .cache import set_similar_users, similar_users_key
+from .jobs import enqueue, job
+from .models import CustomUser, FriendRequest, Friendship, Job
+from .similarity import hobby_index, rank_similar_users_page, similar_users_data
+
+
+class _RefreshBatch:
+    """The users to refresh once the current transaction commits, queued with one enqueue()."""
+
+    def __init__(self) -> None:
+        self.user_ids = set()
+        self.queued = False
+
+    def __call__(self) -> None:
+        self.queued = True
+        enqueue("refresh_similar_users", {str(user_id): {"user_id": user_id} for user_id in sorted(self.user_ids)})
+
+
+def queue_similar_users_refresh(user_ids) -> None:
+    """
+    Refresh the users' pages after the current transaction commits. The signal
+    handlers call this once per changed row, so all the calls of a transaction
+    share one batch and one insert, keeping bulk paths at a fixed query count.
+    A refresh lost to a crash right after the commit only costs a cache miss.
+    """
+    connection = transaction.get_connection(router.db_for_write(Job))
+    if connection.in_atomic_block:
+        for _, callback, _ in connection.run_on_commit:
+            if isinstance(callback, _RefreshBatch) and not callback.queued:
+                callback.user_ids.update(user_ids)
+                return
+    batch = _RefreshBatch()
+    batch.user_ids.update(user_ids)
+    transaction.on_commit(batch, using=connection.alias)
+
+
+@job("refresh_similar_users", batch_size=50)
+def refresh_similar_users(payloads):
+    """
+    Sync the users into this process' hobby index, which may not have seen the
+    change, then cache their first similar_users page with a constant number of
+    queries for the whole batch.
+    """
+    user_ids = {payload["user_id"] for payload in payloads}
+    users = CustomUser.objects.only("id", "date_of_birth").in_bulk(user_ids)
+    held = defaultdict(set)
+    for user_id, hobby_id in CustomUser.hobbies.through.objects.filter(customuser_id__in=users).values_list(
+        "customuser_id", "hobby_id"
+    ):
+        held[user_id].add(hobby_id)
+
+    hobby_index.ensure_built()
+    for user_id in user_ids - set(users):
+        hobby_index.drop_user(user_id)
+    for user in users.values():
+        hobby_index.set_user(user.id, user.date_of_birth)
+        current = hobby_index.hobbies_of(user.id)
+        hobby_index.remove_hobbies(user.id, current - held[user.id])
+        hobby_index.add_hobbies(user.id, held[user.id] - current)
+
+    # Keys first, as in the view: a change committed while ranking makes the result unreachable.
+    params = QueryDict()
+    keys = {user_id: similar_users_key(user_id, params) for user_id in users}
+    pages = {user_id: rank_similar_users_page(user_id, params) for user_id in users}
+    profiles = CustomUser.objects.only("id", "name", "date_of_birth").in_bulk(
+        {row[0] for ranked, _, _ in pages.values() for row in ranked}
+    )
+    friend_ids, sent_request_ids = defaultdict(set), defaultdict(set)
+    for low, high in Friendship.objects.filter(Q(low_id__in=users) | Q(high_id__in=users)).values_list("low_id", "high_id"):
+        friend_ids[low].add(high)
+        friend_ids[high].add(low)
+    for from_id, to_id in FriendRequest.objects.filter(from_user_id__in=users, status="pending").values_list(
+        "from_user_id", "to_user_id"
+    ):
+        sent_request_ids[from_id].add(to_id)
+
+    for user_id, (ranked, mode, page_fields) in pages.items():
+        response = {
+            "users": similar_users_data(ranked, mode, profiles, friend_ids[user_id], sent_request_ids[user_id]),
+            **page_fields,
+        }
+        set_similar_users(keys[user_id], response)
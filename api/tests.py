@@ -0,0 +1,547 @@
+import json
+from datetime import timedelta
+from unittest import skipUnless
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import connection, router
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from project.replicas import PIN_COOKIE, ReplicaMiddleware, primary_reads
+
+from . import jobs, spa
+from .consumers import NotificationConsumer
+from .models import CustomUser, FriendRequest, Friendship, Hobby, Job
+from .similarity import HobbyIndex
+
+
+# Hash inline: the pool's worker processes only add start-up time here.
+@override_settings(PASSWORD_HASHING_WORKERS=0)
+class SignupQueryTests(TestCase):
+    def signup(self, email, hobby_names):
+        # A fresh client each time, so no signup starts from another one's session.
+        response = Client().post("/signup/", json.dumps({
+            "name": "New User",
+            "email": email,
+            "password": "password",
+            "hobbies": [{"name": name} for name in hobby_names],
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_query_count_does_not_grow_with_new_hobbies(self):
+        with CaptureQueriesContext(connection) as one_hobby:
+            self.signup("one@example.com", ["Hobby 0"])
+        with self.assertNumQueries(len(one_hobby)):
+            self.signup("many@example.com", [f"Hobby {i}" for i in range(1, 21)])
+
+        self.assertEqual(Hobby.objects.count(), 21)
+        self.assertEqual(CustomUser.objects.get(email="many@example.com").hobbies.count(), 20)
+
+    def test_query_count_does_not_grow_with_existing_hobbies(self):
+        Hobby.objects.bulk_create([Hobby(name=f"Hobby {i}") for i in range(20)])
+        with CaptureQueriesContext(connection) as one_hobby:
+            self.signup("one@example.com", ["Hobby 0"])
+        with self.assertNumQueries(len(one_hobby)):
+            self.signup("many@example.com", [f"Hobby {i}" for i in range(20)])
+
+
+# The default InMemoryChannelLayer, so events reach sockets of this process. Jobs
+# queued by the committed changes must not run on a thread outside the test's transaction.
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    JOB_IN_PROCESS_WORKER=False,
+)
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(email="alice@example.com", name="Alice", password="password")
+        self.bob = CustomUser.objects.create_user(email="bob@example.com", name="Bob", password="password")
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), "/ws/notifications/")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @database_sync_to_async
+    def committed(self, func):
+        # Events are published on commit, which TestCase otherwise never reaches.
+        with self.captureOnCommitCallbacks(execute=True):
+            return func()
+
+    async def test_new_request_is_pushed_to_recipient(self):
+        bob = await self.connect(self.bob)
+        friend_request = await self.committed(
+            lambda: FriendRequest.objects.create(from_user=self.alice, to_user=self.bob)
+        )
+        event = await bob.receive_json_from()
+        self.assertEqual(event["type"], "friend_request.received")
+        self.assertEqual(event["request"]["id"], friend_request.id)
+        self.assertEqual(event["request"]["from_user_id"], self.alice.id)
+        await bob.disconnect()
+
+    async def test_accepted_request_is_pushed_to_sender(self):
+        friend_request = await database_sync_to_async(FriendRequest.objects.create)(
+            from_user=self.alice, to_user=self.bob
+        )
+        alice = await self.connect(self.alice)
+        await self.committed(friend_request.accept)
+        event = await alice.receive_json_from()
+        self.assertEqual(event["type"], "friend_request.accepted")
+        self.assertEqual(event["request"]["to_user_id"], self.bob.id)
+        self.assertTrue(await alice.receive_nothing())
+        await alice.disconnect()
+
+
+@skipUnless(spa.brotli, "brotli is not installed")
+class SpaShellTests(SimpleTestCase):
+    def get(self, accept_encoding, **headers):
+        return self.client.get("/", headers={"Accept-Encoding": accept_encoding, **headers})
+
+    def test_each_encoding_has_its_own_etag(self):
+        responses = {encoding: self.get(encoding) for encoding in ("br", "gzip", "identity")}
+
+        self.assertEqual(responses["br"]["Content-Encoding"], "br")
+        self.assertEqual(responses["gzip"]["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Encoding", responses["identity"])
+        self.assertEqual(spa.brotli.decompress(responses["br"].content), responses["identity"].content)
+        self.assertEqual(len({response["ETag"] for response in responses.values()}), 3)
+
+    def test_etag_only_matches_its_own_encoding(self):
+        etag = self.get("br, gzip")["ETag"]
+        self.assertEqual(self.get("br, gzip", **{"If-None-Match": etag}).status_code, 304)
+        self.assertEqual(self.get("gzip", **{"If-None-Match": etag}).status_code, 200)
+
+
+# Only the routing decisions are under test, so the replica alias is never connected to.
+# A TestCase would not do: reads inside its transaction always go to the primary.
+@override_settings(DATABASES={
+    **settings.DATABASES,
+    "replica": {"ENGINE": "django.db.backends.sqlite3", "NAME": "replica.sqlite3"},
+})
+class ReplicaRouterTests(SimpleTestCase):
+    def request(self, method, write=False, cookies=None, during=None):
+        """Run ``method`` through ReplicaMiddleware; returns (response, aliases the view read from)."""
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Hobby))
+            if write:
+                router.db_for_write(Hobby)
+                reads.append(router.db_for_read(Hobby))
+            if during is not None:
+                with during():
+                    reads.append(router.db_for_read(Hobby))
+            return HttpResponse()
+
+        request = RequestFactory().generic(method, "/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaMiddleware(view)(request), reads
+
+    def test_safe_requests_read_from_replica(self):
+        for method in ("GET", "HEAD", "OPTIONS"):
+            response, reads = self.request(method)
+            self.assertEqual(reads, ["replica"])
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_requests_read_from_primary_and_pin(self):
+        response, reads = self.request("POST", write=True)
+        self.assertEqual(reads, ["default", "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_go_to_primary(self):
+        response, reads = self.request("GET", write=True)
+        self.assertEqual(reads, ["replica", "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pinned_client_reads_from_primary(self):
+        response, _ = self.request("POST", write=True)
+        pin = response.cookies[PIN_COOKIE].value
+        _, reads = self.request("GET", cookies={PIN_COOKIE: pin})
+        self.assertEqual(reads, ["default"])
+        _, reads = self.request("GET", cookies={PIN_COOKIE: "0"})
+        self.assertEqual(reads, ["replica"])
+        _, reads = self.request("GET", cookies={PIN_COOKIE: "garbage"})
+        self.assertEqual(reads, ["replica"])
+
+    def test_primary_reads_block(self):
+        response, reads = self.request("GET", during=primary_reads)
+        self.assertEqual(reads, ["replica", "default"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_outside_requests_go_to_primary(self):
+        self.assertEqual(router.db_for_read(Hobby), "default")
+
+
+@override_settings(JOB_IN_PROCESS_WORKER=False, JOB_MAX_ATTEMPTS=3, JOB_RETRY_BACKOFF=10, JOB_LEASE_SECONDS=300)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.batches = []
+        self.failing = False
+        jobs.job("test.record", batch_size=3)(self.record)
+        self.addCleanup(jobs._handlers.pop, "test.record")
+
+    def record(self, payloads):
+        self.batches.append(payloads)
+        if self.failing:
+            raise RuntimeError("handler failed")
+
+    def make_due(self, **filters):
+        Job.objects.filter(**filters).update(run_after=timezone.now() - timedelta(seconds=1))
+
+    def test_pending_jobs_are_unique_per_kind_and_key(self):
+        jobs.enqueue("test.record", {"a": {"n": 1}, "b": {"n": 1}})
+        jobs.enqueue("test.record", {"a": {"n": 2}})
+        jobs.enqueue("test.other", {"a": {"n": 1}})
+        jobs.enqueue("test.record", {None: {"n": 1}})
+        jobs.enqueue("test.record", {None: {"n": 2}})
+
+        self.assertEqual(Job.objects.filter(kind="test.record", key="a").get().payload, {"n": 1})
+        self.assertEqual(Job.objects.filter(kind="test.record", key=None).count(), 2)
+        self.assertEqual(Job.objects.filter(kind="test.other").count(), 1)
+
+    def test_due_jobs_are_claimed_in_batches(self):
+        jobs.enqueue("test.record", {str(i): {"n": i} for i in range(5)})
+
+        self.assertEqual(jobs.run_due(), 5)
+        self.assertEqual([len(batch) for batch in self.batches], [3, 2])
+        self.assertEqual(Job.objects.filter(status="done").count(), 5)
+        self.assertEqual(jobs.claim(), [])
+
+    def test_failed_batches_back_off_then_fail(self):
+        self.failing = True
+        jobs.enqueue("test.record", {"a": {"n": 1}})
+
+        for attempt in range(1, 3):
+            before = timezone.now()
+            with self.assertLogs("api.jobs", "ERROR"):
+                self.assertEqual(jobs.run_due(), 1)
+            job_row = Job.objects.get()
+            self.assertEqual((job_row.status, job_row.attempts), ("pending", attempt))
+            self.assertGreaterEqual(job_row.run_after, before + timedelta(seconds=10 * 2 ** (attempt - 1)))
+            self.assertIn("handler failed", job_row.last_error)
+            self.assertEqual(jobs.run_due(), 0)
+            self.make_due()
+
+        with self.assertLogs("api.jobs", "ERROR"):
+            self.assertEqual(jobs.run_due(), 1)
+        job_row = Job.objects.get()
+        self.assertEqual((job_row.status, job_row.attempts), ("failed", 3))
+        self.assertIsNotNone(job_row.finished_at)
+        self.assertEqual(jobs.run_due(), 0)
+
+    def test_retry_is_dropped_for_a_job_enqueued_again_while_running(self):
+        jobs.enqueue("test.record", {"a": {"n": 1}})
+        claimed = jobs.claim()
+        jobs.enqueue("test.record", {"a": {"n": 2}})
+        self.failing = True
+        with self.assertLogs("api.jobs", "ERROR"):
+            jobs.run_batch(claimed)
+
+        job_row = Job.objects.get()
+        self.assertEqual((job_row.status, job_row.payload, job_row.attempts), ("pending", {"n": 2}, 0))
+
+    def test_expired_leases_are_claimed_again(self):
+        jobs.enqueue("test.record", {"a": {"n": 1}})
+        self.assertEqual(len(jobs.claim()), 1)
+        self.assertEqual(jobs.claim(), [])
+
+        Job.objects.update(started_at=timezone.now() - timedelta(seconds=301))
+        claimed = jobs.claim()
+        self.assertEqual([job_row.attempts for job_row in claimed], [2])
+        jobs.run_batch(claimed)
+        self.assertEqual(Job.objects.get().status, "done")
+
+
+# The in-process worker would run the queued refreshes outside the test's transaction.
+@override_settings(JOB_IN_PROCESS_WORKER=False)
+class AcceptManyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="user@example.com", name="User", password="password")
+        CustomUser.objects.bulk_create([CustomUser(email=f"sender{i}@example.com", name=f"Sender {i}") for i in range(45)])
+        self.senders = list(CustomUser.objects.exclude(id=self.user.id).order_by("id"))
+
+    def requests_from(self, senders):
+        return [FriendRequest.objects.create(from_user=sender, to_user=self.user).id for sender in senders]
+
+    def test_query_count_does_not_grow_with_requests(self):
+        few = self.requests_from(self.senders[:5])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            FriendRequest.accept_many(self.user, few)
+
+        many = self.requests_from(self.senders[5:])
+        with self.assertNumQueries(len(queries)), self.captureOnCommitCallbacks(execute=True):
+            FriendRequest.accept_many(self.user, many)
+
+        self.assertEqual(len(CustomUser.objects.get(id=self.user.id).friend_ids()), 45)
+        refreshed = set(Job.objects.filter(kind="refresh_similar_users").values_list("key", flat=True))
+        self.assertEqual(refreshed, {str(user.id) for user in [self.user, *self.senders]})
+
+
+class HobbyIndexTests(TestCase):
+    def setUp(self):
+        self.hobby = Hobby.objects.create(name="Chess")
+        self.user = CustomUser.objects.create_user(email="user@example.com", name="User", password="password")
+        self.index = HobbyIndex()
+        self.index.ensure_built()
+
+    def wait_for_rebuild(self, name):
+        with self.index._build_locks[name]:
+            pass
+
+    @override_settings(SIMILARITY_VECTORS_REFRESH=0)
+    def test_stale_vectors_are_served_while_rebuilding(self):
+        stale = self.index.vectors()
+        self.index.add_hobbies(self.user.id, [self.hobby.id])
+
+        self.assertIs(self.index.vectors(), stale)
+        self.wait_for_rebuild("vectors")
+        fresh = self.index.vectors()
+        self.assertIsNot(fresh, stale)
+        self.assertEqual(list(fresh.hobby_ids), [self.hobby.id])
+
+    @override_settings(SIMILARITY_VECTORS_REFRESH=0, SIMILARITY_LSH_REFRESH=0)
+    def test_stale_lsh_is_served_while_rebuilding(self):
+        stale = self.index.lsh()
+        self.index.add_hobbies(self.user.id, [self.hobby.id])
+        self.index.vectors()
+        self.wait_for_rebuild("vectors")
+
+        self.assertIs(self.index.lsh(), stale)
+        self.wait_for_rebuild("lsh")
+        self.assertIsNot(self.index.lsh(), stale)
+
+    def test_changes_during_a_rebuild_are_kept(self):
+        read_and_publish = self.index._read_and_publish
+
+        def change_during_read():
+            # Never written to the database, so only the replay can add it.
+            self.index.add_hobbies(self.user.id, [self.hobby.id])
+            read_and_publish()
+
+        self.index._read_and_publish = change_during_read
+        self.index._build()
+        self.assertEqual(self.index.hobbies_of(self.user.id), {self.hobby.id})
+
+
+class SimilarUsersParamsTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="user@example.com", name="User", password="password")
+        self.client.force_login(user)
+
+    def assertRejected(self, error, **params):
+        response = self.client.get("/similar_users/", params)
+        self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(response.json(), {"error": error})
+
+    def test_malformed_cursors_are_rejected(self):
+        # nan:1, inf:1, "foo", "1:x", not base64 and not UTF-8.
+        for cursor in ("bmFuOjE", "aW5mOjE", "Zm9v", "MTp4", "!!!", "_w"):
+            self.assertRejected("Invalid cursor.", cursor=cursor)
+        self.assertEqual(self.client.get("/similar_users/", {"cursor": "MTox"}).status_code, 200)
+
+    def test_malformed_numbers_are_rejected(self):
+        for page in ("0", "-1", "1.5", "x"):
+            self.assertRejected("page must be an integer of at least 1", page=page)
+        for value in ("-1", "151", "x", "9" * 20):
+            self.assertRejected("age_min must be an integer from 0 to 150", age_min=value)
+            self.assertRejected("age_max must be an integer from 0 to 150", age_max=value)
+        self.assertEqual(self.client.get("/similar_users/", {"page": "2", "age_min": "0", "age_max": "150"}).status_code, 200)
+
+
+class FriendshipTests(TestCase):
+    def setUp(self):
+        self.low, self.high, self.other = [
+            CustomUser.objects.create_user(email=f"{name}@example.com", name=name, password="password")
+            for name in ("low", "high", "other")
+        ]
+
+    def edges(self):
+        return set(Friendship.objects.values_list("low_id", "high_id"))
+
+    def test_add_friend_stores_one_ordered_edge(self):
+        self.high.add_friend(self.low)
+        self.low.add_friend(self.high)
+        self.high.add_friend(self.low)
+        self.low.add_friend(self.low)
+
+        self.assertEqual(self.edges(), {(self.low.id, self.high.id)})
+        low, high = CustomUser.objects.get(id=self.low.id), CustomUser.objects.get(id=self.high.id)
+        self.assertTrue(low.is_friend(high))
+        self.assertTrue(high.is_friend(low))
+        self.assertFalse(low.is_friend(self.other))
+
+    def test_add_friends_skips_self_duplicates_and_existing(self):
+        self.low.add_friend(self.high)
+        self.low.add_friends([self.high.id, self.other.id, self.other.id, self.low.id])
+        self.other.add_friends([self.low.id])
+
+        self.assertEqual(self.edges(), {(self.low.id, self.high.id), (self.low.id, self.other.id)})
+        self.assertEqual(CustomUser.objects.get(id=self.other.id).friend_ids(), {self.low.id})
+
+    def test_remove_friend_from_either_side(self):
+        self.low.add_friends([self.high.id, self.other.id])
+        self.high.remove_friend(self.low)
+        self.high.remove_friend(self.low)
+        self.other.remove_friend(self.high)
+
+        self.assertEqual(self.edges(), {(self.low.id, self.other.id)})
+        self.assertFalse(CustomUser.objects.get(id=self.high.id).is_friend(self.low))
+
+    def test_friend_ids_is_loaded_once_and_kept_current(self):
+        self.low.add_friend(self.other)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.low.friend_ids(), {self.other.id})
+            self.assertTrue(self.low.is_friend(self.other))
+        self.high.friend_ids()
+
+        self.low.add_friend(self.high)
+        self.high.remove_friend(self.other)
+        self.other.remove_friend(self.low)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.low.friend_ids(), {self.high.id})
+            self.assertEqual(self.high.friend_ids(), {self.low.id})
+
+
+class FriendshipMigrationTests(TransactionTestCase):
+    """0007_friendship collapses the doubled CustomUser.friends rows into Friendship edges, and back."""
+
+    before = [("api", "0006_customuser_friends_friendrequest")]
+    after = [("api", "0007_friendship")]
+
+    def setUp(self):
+        self.addCleanup(self.migrate, None)
+        apps = self.migrate(self.before)
+        HistoricalUser = apps.get_model("api", "CustomUser")
+        self.a, self.b, self.c = [
+            HistoricalUser.objects.create(email=f"{name}@example.com", name=name, password="!").id
+            for name in ("a", "b", "c")
+        ]
+        self.through = HistoricalUser.friends.through
+
+    def migrate(self, targets):
+        """Migrate to ``targets`` (the latest state when None) and return the apps at that state."""
+        executor = MigrationExecutor(connection)
+        targets = targets or executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        return MigrationExecutor(connection).loader.project_state(targets).apps
+
+    def friend_rows(self, apps):
+        through = apps.get_model("api", "CustomUser").friends.through
+        return set(through.objects.values_list("from_customuser_id", "to_customuser_id"))
+
+    def test_forwards_and_backwards(self):
+        a, b, c = self.a, self.b, self.c
+        # a and b both ways, a -> c one way only, and a row of a with itself.
+        self.through.objects.bulk_create([
+            self.through(from_customuser_id=from_id, to_customuser_id=to_id)
+            for from_id, to_id in ((a, b), (b, a), (c, a), (a, a))
+        ])
+
+        apps = self.migrate(self.after)
+        edges = set(apps.get_model("api", "Friendship").objects.values_list("low_id", "high_id"))
+        self.assertEqual(edges, {(a, b), (a, c)})
+
+        apps = self.migrate(self.before)
+        self.assertEqual(self.friend_rows(apps), {(a, b), (b, a), (a, c), (c, a)})
+
+
+@override_settings(JOB_IN_PROCESS_WORKER=False)
+class BulkFriendRequestTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="user@example.com", name="User", password="password")
+        CustomUser.objects.bulk_create([CustomUser(email=f"other{i}@example.com", name=f"Other {i}") for i in range(30)])
+        self.others = list(CustomUser.objects.exclude(id=self.user.id).order_by("id"))
+        self.client.force_login(self.user)
+
+    def post(self, action, key, ids):
+        response = self.client.post(
+            f"/friend_requests/{action}/bulk/", json.dumps({key: ids}), content_type="application/json"
+        )
+        return response.status_code, response.json()
+
+    def requests_from(self, senders):
+        return [FriendRequest.objects.create(from_user=sender, to_user=self.user).id for sender in senders]
+
+    def test_malformed_ids_are_rejected(self):
+        for ids in (None, "1", [1.0], ["1"], [True], [False], [0], [-1], [2 ** 63], [[1]]):
+            self.assertEqual(self.post("accept", "request_ids", ids), (400, {"error": "'request_ids' must be a list of ids."}))
+        self.assertEqual(
+            self.post("send", "user_ids", list(range(1, 102))), (400, {"error": "'user_ids' may hold at most 100 ids."})
+        )
+        response = self.client.post("/friend_requests/reject/bulk/", "{", content_type="application/json")
+        self.assertEqual((response.status_code, response.json()), (400, {"error": "Invalid JSON data."}))
+        self.assertFalse(FriendRequest.objects.exists())
+
+    def test_send_results(self):
+        stranger, friend, pending = self.others[:3]
+        self.user.add_friend(friend)
+        FriendRequest.objects.create(from_user=self.user, to_user=pending)
+        missing = max(user.id for user in self.others) + 1
+
+        ids = [stranger.id, friend.id, pending.id, self.user.id, missing, stranger.id]
+        status, body = self.post("send", "user_ids", ids)
+        self.assertEqual(status, 200)
+        self.assertEqual([result["status"] for result in body["results"]],
+                         ["sent", "already_friends", "already_sent", "invalid", "not_found", "sent"])
+        self.assertEqual(FriendRequest.objects.filter(from_user=self.user, to_user=stranger).count(), 1)
+
+    def test_accept_and_reject_results(self):
+        accepted, rejected = self.requests_from(self.others[:2])
+        taken = FriendRequest.objects.create(from_user=self.others[2], to_user=self.others[3]).id
+
+        self.assertEqual(self.post("accept", "request_ids", [accepted, taken]), (200, {"results": [
+            {"id": accepted, "status": "accepted"}, {"id": taken, "status": "not_found"},
+        ]}))
+        self.assertEqual(self.post("reject", "request_ids", [rejected, accepted]), (200, {"results": [
+            {"id": rejected, "status": "rejected"}, {"id": accepted, "status": "not_found"},
+        ]}))
+        self.assertEqual(self.user.friend_ids(), {self.others[0].id})
+
+    def test_query_counts_do_not_grow_with_ids(self):
+        ids = [user.id for user in self.others]
+        with CaptureQueriesContext(connection) as queries:
+            self.post("send", "user_ids", ids[:2])
+        with self.assertNumQueries(len(queries)):
+            self.post("send", "user_ids", ids[2:])
+        self.assertEqual(FriendRequest.objects.filter(from_user=self.user).count(), 30)
+        FriendRequest.objects.all().delete()
+
+        # Rejected first, as accepting befriends the senders for good.
+        for action in ("reject", "accept"):
+            few, many = self.requests_from(self.others[:2]), self.requests_from(self.others[2:])
+            with CaptureQueriesContext(connection) as queries:
+                self.post(action, "request_ids", few)
+            with self.assertNumQueries(len(queries)):
+                _, body = self.post(action, "request_ids", many)
+            self.assertEqual({result["status"] for result in body["results"]}, {f"{action}ed"})
+            FriendRequest.objects.all().delete()
+        self.assertEqual(len(CustomUser.objects.get(id=self.user.id).friend_ids()), 30)
+
+
+@override_settings(METRICS_TOKEN="s3cret")
+class MetricsAccessTests(TestCase):
+    def get(self, **headers):
+        return self.client.get("/metrics", headers=headers, REMOTE_ADDR="127.0.0.1").status_code
+
+    def test_token_or_staff_is_required(self):
+        self.assertEqual(self.get(), 403)
+        self.assertEqual(self.get(Authorization="Bearer wrong"), 403)
+        self.assertEqual(self.get(Authorization="Basic s3cret"), 403)
+        self.assertEqual(self.get(Authorization="Bearer s3cret"), 200)
+
+        staff = CustomUser.objects.create_user(email="staff@example.com", name="Staff", password="password")
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        self.assertEqual(self.get(), 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_no_token_is_accepted_when_unset(self):
+        self.assertEqual(self.get(Authorization="Bearer "), 403)
+        self.assertEqual(self.get(Authorization="Bearer"), 403)
@@ -0,0 +1,127 @@
+"""
+Trending hobbies: how often each hobby was added to a profile recently.
+
+Adds are counted in ``HobbyTrend`` rows, one per hobby and time bucket of
+``TRENDING_BUCKET_SECONDS``. Each process buffers its counts and writes them
+as one batch once ``TRENDING_FLUSH_INTERVAL`` seconds have passed (and at
+exit), so profile updates and signups pay no extra queries for them. The
+trending list sums the buckets of the last ``TRENDING_WINDOW`` seconds, so
+it lags behind the adds by up to the flush interval plus
+``TRENDING_CACHE_TIMEOUT``.
+
+Old buckets are deleted by ``manage.py reconcile_hobby_counts``.
+"""
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Hobby, HobbyTrend
+
+
+def _bucket_seconds() -> int:
+    return getattr(settings, "TRENDING_BUCKET_SECONDS", 3600)
+
+
+def bucket_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the bucket holding ``now``."""
+    seconds = _bucket_seconds()
+    timestamp = (now or timezone.now()).timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def window_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the oldest bucket inside the trending window."""
+    window = getattr(settings, "TRENDING_WINDOW", 86400)
+    return bucket_start(now) - timedelta(seconds=window - _bucket_seconds())
+
+
+class TrendBuffer:
+    """Thread-safe per-process counts of (bucket, hobby id) to adds, waiting to be written."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._pending_since: Optional[float] = None
+
+    def record(self, hobby_adds: Dict[int, int]) -> None:
+        bucket = bucket_start()
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            for hobby_id, adds in hobby_adds.items():
+                self._pending[bucket, hobby_id] += adds
+
+    def take_due(self, force: bool = False) -> Dict[Tuple[datetime, int], int]:
+        """The buffered counts, if they are old enough (or ``force``), emptying the buffer."""
+        interval = getattr(settings, "TRENDING_FLUSH_INTERVAL", 10)
+        with self._lock:
+            if not self._pending:
+                return {}
+            if not force and time.monotonic() - self._pending_since < interval:
+                return {}
+            pending, self._pending = self._pending, Counter()
+            return pending
+
+
+def record_adds(hobby_adds: Dict[int, int]) -> None:
+    trend_buffer.record(hobby_adds)
+    flush_trends()
+
+
+def flush_trends(force: bool = False) -> None:
+    """
+    Add the buffered counts to their HobbyTrend rows: one insert of the
+    missing rows, then one UPDATE per bucket (usually just the current one).
+    """
+    pending = trend_buffer.take_due(force)
+    if not pending:
+        return
+    db = router.db_for_write(HobbyTrend)
+    # Hobbies deleted since their adds were counted would violate the foreign key.
+    existing = set(Hobby.objects.using(db).filter(pk__in={hobby_id for _, hobby_id in pending}).values_list("pk", flat=True))
+    by_bucket = defaultdict(dict)
+    for (bucket, hobby_id), adds in pending.items():
+        if hobby_id in existing:
+            by_bucket[bucket][hobby_id] = adds
+
+    with transaction.atomic(using=db):
+        HobbyTrend.objects.using(db).bulk_create(
+            [HobbyTrend(hobby_id=hobby_id, bucket=bucket) for bucket, adds in by_bucket.items() for hobby_id in adds],
+            ignore_conflicts=True,
+        )
+        for bucket, adds in by_bucket.items():
+            HobbyTrend.objects.using(db).filter(bucket=bucket, hobby_id__in=adds).update(adds=F("adds") + Case(
+                *(When(hobby_id=hobby_id, then=Value(count)) for hobby_id, count in adds.items()),
+                output_field=IntegerField(),
+            ))
+
+
+def trending_hobbies(limit: int) -> List[Dict]:
+    """The ``limit`` hobbies added most often within the window, ties broken by members, then name."""
+    rows = (
+        HobbyTrend.objects.filter(bucket__gte=window_start())
+        .values("hobby_id", "hobby__name", "hobby__member_count")
+        .annotate(recent=Sum("adds"))
+        .order_by("-recent", "-hobby__member_count", "hobby__name")[:limit]
+    )
+    return [
+        {"id": row["hobby_id"], "name": row["hobby__name"], "memberCount": row["hobby__member_count"], "recentAdds": row["recent"]}
+        for row in rows
+    ]
+
+
+def prune_trends() -> int:
+    """Delete the buckets that have left the window. Returns the number of rows deleted."""
+    return HobbyTrend.objects.filter(bucket__lt=window_start()).delete()[0]
+
+
+trend_buffer = TrendBuffer()
+atexit.register(lambda: flush_trends(force=True))
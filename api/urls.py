@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the read-heavy endpoints are served by their native async versions.
+read_views = async_views if settings.SERVER_MODE == "asgi" else views
 
 urlpatterns = [
     path('', views.main_spa),
@@ -11,25 +15,37 @@ urlpatterns = [
     # csrf
     path('set-csrf-token/', views.set_csrf_token, name='set_csrf_token'),
 
+    # Everything the SPA needs on start-up
+    path('bootstrap/', read_views.bootstrap, name='bootstrap'),
+
     # Profile
-    path("profile/", views.profile_api, name="profile_api"),
+    path("profile/", read_views.profile_api, name="profile_api"),
     path("profile/update/", views.update_profile_api, name="profile_api"),
 
     # Password
     path("profile/password/update/", views.update_password_api, name="update_password"),
     
     # hobbies
-    path("hobbies/", views.hobbies_api, name="hobbies"),
+    path("hobbies/", read_views.hobbies_api, name="hobbies"),
     path("hobbies/add/", views.add_hobby, name="add_hobby"),
+    path("hobbies/search/", views.search_hobbies, name="search_hobbies"),
+    path("hobbies/trending/", views.trending_hobbies_api, name="trending_hobbies"),
 
     # friends
-    path('friends/', views.list_friends, name='list_friends'),
-    path('friend_requests/sent/', views.list_sent_requests, name='list_sent_requests'),
-    path('friend_requests/received/', views.list_received_requests, name='list_received_requests'),
+    path('friends/', read_views.list_friends, name='list_friends'),
+    path('friends/suggestions/', views.friend_suggestions, name='friend_suggestions'),
+    path('friend_requests/sent/', read_views.list_sent_requests, name='list_sent_requests'),
+    path('friend_requests/received/', read_views.list_received_requests, name='list_received_requests'),
     path('friend_requests/send/<int:user_id>/', views.send_friend_request, name='send_friend_request'),
     path('friend_requests/accept/<int:request_id>/', views.accept_friend_request, name='accept_friend_request'),
     path('friend_requests/reject/<int:request_id>/', views.reject_friend_request, name='reject_friend_request'),
+    path('friend_requests/send/bulk/', views.send_friend_requests, name='send_friend_requests'),
+    path('friend_requests/accept/bulk/', views.accept_friend_requests, name='accept_friend_requests'),
+    path('friend_requests/reject/bulk/', views.reject_friend_requests, name='reject_friend_requests'),
 
     # Similar users
-    path('similar_users/', views.similar_users, name='similar_users'),
+    path('similar_users/', read_views.similar_users, name='similar_users'),
+
+    # Background jobs
+    path('jobs/metrics/', views.job_metrics, name='job_metrics'),
 ]
@@ -1,20 +1,37 @@
-from typing import Any, Dict
-from django.http import JsonResponse, HttpRequest
-from django.shortcuts import render
+from typing import Any, Dict, Optional
+from django.http import JsonResponse, HttpRequest, HttpResponse, HttpResponseNotModified
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib.auth import update_session_auth_hash, login, logout, authenticate
-from .models import CustomUser, Hobby
+from .models import CustomUser, Friendship, Hobby
+import gzip
+import hashlib
 import json
-from django.db.models import Count, Q
-from datetime import date, timedelta, datetime
+from datetime import datetime
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
 from .models import FriendRequest
+from .cache import (
+    catalogue_version, get_catalogue, get_similar_users, get_trending, set_catalogue, set_similar_users,
+    set_trending, similar_users_key, user_snapshot,
+)
+from .graph import suggest_friends
+from .hashers import HashingPoolSaturated
+from .jobs import job_stats
+from .search import hobby_search
+from .spa import accepted_encoding, spa_shell
+from .similarity import rank_similar_users_page, similar_users_data
+from .trending import trending_hobbies
+from project.replicas import primary_reads
 from typing import List, TypedDict
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 
 
 @ensure_csrf_cookie
@@ -24,23 +41,43 @@ def set_csrf_token(request):
     return response
 
 
-# Render the main SPA
-def main_spa(request: HttpRequest) -> JsonResponse:
-    return render(request, 'api/spa/index.html', {})
+# Serve the main SPA shell from memory, compressed as the client accepts, preloading its assets
+def main_spa(request: HttpRequest) -> HttpResponse:
+    shell = spa_shell.get()
+    encoding = accepted_encoding(request.headers.get("Accept-Encoding", ""), shell.bodies)
+    etag = shell.etags[encoding]
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(shell.bodies[encoding], content_type="text/html; charset=utf-8")
+        if encoding != "identity":
+            response["Content-Encoding"] = encoding
+        response["Cache-Control"] = "no-cache"
+        if shell.link:
+            response["Link"] = shell.link
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+# Respond with ``envelope`` as JSON and a user's pre-serialized snapshot spliced in under ``field``
+def snapshot_response(envelope: Dict[str, Any], field: str, snapshot: bytes) -> HttpResponse:
+    body = json.dumps(envelope)[:-1].encode() + f', "{field}": '.encode() + snapshot + b"}"
+    return HttpResponse(body, content_type="application/json")
+
+
+# Shed password checks and changes while the hashing pool is saturated
+def hashing_unavailable() -> JsonResponse:
+    response = JsonResponse({"success": False, "message": "Server busy, please try again shortly."}, status=503)
+    response["Retry-After"] = "1"
+    return response
 
 
 # Fetch the current user's profile data
 @login_required
 def profile_api(request: HttpRequest) -> JsonResponse:
     if request.method == "GET":
-        user: CustomUser = request.user
-        data: Dict[str, Any] = {
-            "name": user.name,
-            "email": user.email,
-            "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
-            "hobbies": list(user.hobbies.values('id', 'name')),
-        }
-        return JsonResponse({"success": True, "data": data})
+        return snapshot_response({"success": True}, "data", user_snapshot(request.user))
     return JsonResponse({"success": False, "message": "Invalid request method."}, status=405)
 
 
@@ -91,31 +128,15 @@ def update_profile_api(request: HttpRequest) -> JsonResponse:
 
         if updated_fields:
             user.save()
-            
-            updated_data = {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
-                "hobbies": list(user.hobbies.values('id', 'name')),
-            }
-            return JsonResponse({
+            return snapshot_response({
                 "success": True, 
                 "message": f"Updated: {', '.join(updated_fields)}",
-                "data": updated_data
-            })
+            }, "data", user_snapshot(user))
         else:
-            return JsonResponse({
+            return snapshot_response({
                 "success": True, 
                 "message": "No changes detected",
-                "data": {
-                    "id": user.id,
-                    "name": user.name,
-                    "email": user.email,
-                    "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
-                    "hobbies": list(user.hobbies.values('id', 'name')),
-                }
-            })
+            }, "data", user_snapshot(user))
             
     except Exception as e:
         return JsonResponse({
@@ -164,6 +185,8 @@ def update_password_api(request: HttpRequest) -> JsonResponse:
             'message': 'Password updated successfully'
         })
         
+    except HashingPoolSaturated:
+        return hashing_unavailable()
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -171,11 +194,50 @@ def update_password_api(request: HttpRequest) -> JsonResponse:
         }, status=400)
 
 
+def catalogue_bodies(hobbies: List[Dict[str, Any]]) -> tuple:
+    """The catalogue as ``(json, gzipped json, content hash)``."""
+    body = json.dumps(hobbies).encode()
+    return body, gzip.compress(body), hashlib.sha256(body).hexdigest()[:16]
+
+
+# Each encoding is its own representation, so the gzipped body gets its own ETag
+def catalogue_etag(bodies: tuple, encoding: str = "identity") -> str:
+    return f'"hobbies-{bodies[2]}-gz"' if encoding == "gzip" else f'"hobbies-{bodies[2]}"'
+
+
+# The catalogue bodies at the current version, from the cache or built from the DB
+def load_catalogue() -> tuple:
+    version = catalogue_version()
+    bodies = get_catalogue(version)
+    if bodies is None:
+        with primary_reads():
+            bodies = catalogue_bodies(list(Hobby.objects.all().values("id", "name")))
+        set_catalogue(version, bodies)
+    return bodies
+
+
+# The hobby catalogue in the encoding the client accepts, or a 304 when it holds that representation
+def catalogue_response(request: HttpRequest, bodies: tuple) -> HttpResponse:
+    encoding = accepted_encoding(request.headers.get("Accept-Encoding", ""), ("identity", "gzip"))
+    etag = catalogue_etag(bodies, encoding)
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(bodies[1] if encoding == "gzip" else bodies[0], content_type="application/json")
+        if encoding == "gzip":
+            response["Content-Encoding"] = "gzip"
+        response["Cache-Control"] = "no-cache"
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
 # Fetch all hobbies
 def hobbies_api(request: HttpRequest) -> JsonResponse:
     if request.method == "GET":
-        hobbies = Hobby.objects.all().values("id", "name")
-        return JsonResponse(list(hobbies), safe=False)
+        # The ETag is a hash of the body, so it only changes with the catalogue; while the
+        # bodies are cached, unchanged catalogues are a 304 without touching the DB.
+        return catalogue_response(request, load_catalogue())
     elif request.method == "POST":
         try:
             data=json.loads(request.body)
@@ -192,6 +254,107 @@ def hobbies_api(request: HttpRequest) -> JsonResponse:
     return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
+# One section of bootstrap: its ETag plus the pre-serialized ``data``, or just
+# the ETag and "unchanged" when the client already holds that version
+def bootstrap_section(etag: str, data: Optional[bytes], known: List[str]) -> bytes:
+    if etag in known:
+        return json.dumps({"etag": etag, "unchanged": True}).encode()
+    return json.dumps({"etag": etag})[:-1].encode() + b', "data": ' + data + b"}"
+
+
+def content_etag(section: str, data: bytes) -> str:
+    return f'"{section}-{hashlib.sha256(data).hexdigest()[:16]}"'
+
+
+# The user's friends, as list_friends lists them, in one query with both Friendship directions as subqueries
+def bootstrap_friends(user):
+    return CustomUser.objects.filter(
+        Q(id__in=Friendship.objects.filter(low=user).values("high"))
+        | Q(id__in=Friendship.objects.filter(high=user).values("low"))
+    ).order_by("id").values("id", "name", "email")
+
+
+# The user's sent and received pending requests together, in one query
+def bootstrap_pending_requests(user):
+    return FriendRequest.objects.filter(Q(from_user=user) | Q(to_user=user), status="pending").select_related(
+        "from_user", "to_user"
+    ).only("id", "status", "created_at", "from_user__name", "to_user__name").order_by("id")
+
+
+# The friends, sent_requests and received_requests sections, each shaped like its own endpoint's payload
+def bootstrap_friend_sections(user_id: int, friends: List[Dict[str, Any]], pending, known: List[str]) -> Dict[str, bytes]:
+    sent, received = [], []
+    for fr in pending:
+        if fr.from_user_id == user_id:
+            sent.append({'id': fr.id, 'to_user': fr.to_user.name, 'status': fr.status, 'created_at': fr.created_at})
+        else:
+            received.append({'id': fr.id, 'from_user': fr.from_user.name, 'status': fr.status, 'created_at': fr.created_at})
+    sections = {}
+    for name, rows in (("friends", friends), ("sent_requests", sent), ("received_requests", received)):
+        data = json.dumps({name: rows}, cls=DjangoJSONEncoder).encode()
+        sections[name] = bootstrap_section(content_etag(name, data), data, known)
+    return sections
+
+
+def bootstrap_response(request: HttpRequest, authenticated: bool, sections: Dict[str, bytes]) -> HttpResponse:
+    envelope = json.dumps({"csrfToken": get_token(request), "authenticated": authenticated})[:-1].encode()
+    body = envelope + b', "sections": {' + b", ".join(
+        json.dumps(name).encode() + b": " + section for name, section in sections.items()
+    ) + b"}}"
+    response = HttpResponse(body, content_type="application/json")
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Everything the SPA loads on start-up in one response and a fixed number of queries: the CSRF
+# token, the hobby catalogue and, when logged in, the profile, friends and pending requests.
+# Sections whose ETag the client sends in If-None-Match are returned without their data.
+@ensure_csrf_cookie
+@require_http_methods(["GET"])
+def bootstrap(request: HttpRequest) -> HttpResponse:
+    known = parse_etags(request.headers.get("If-None-Match", ""))
+    sections = {}
+
+    bodies = load_catalogue()
+    sections["hobbies"] = bootstrap_section(catalogue_etag(bodies), bodies[0], known)
+
+    user = request.user
+    if user.is_authenticated:
+        snapshot = user_snapshot(user)
+        sections["profile"] = bootstrap_section(content_etag("profile", snapshot), snapshot, known)
+        sections.update(bootstrap_friend_sections(
+            user.id, list(bootstrap_friends(user)), bootstrap_pending_requests(user), known
+        ))
+    return bootstrap_response(request, user.is_authenticated, sections)
+
+
+# Autocomplete hobby names: prefix matches first, then substring matches, by popularity
+def search_hobbies(request: HttpRequest) -> JsonResponse:
+    if request.method == "GET":
+        query = request.GET.get("q", "")
+        try:
+            limit = max(1, min(int(request.GET.get("limit", 10)), 50))
+        except ValueError:
+            return JsonResponse({"error": "limit must be an integer."}, status=400)
+        return JsonResponse(hobby_search.search(query, limit), safe=False)
+    return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+# The hobbies added to profiles most often lately, with their member counts
+def trending_hobbies_api(request: HttpRequest) -> JsonResponse:
+    if request.method == "GET":
+        try:
+            limit = max(1, min(int(request.GET.get("limit", 10)), 50))
+        except ValueError:
+            return JsonResponse({"error": "limit must be an integer."}, status=400)
+        hobbies = get_trending(limit)
+        if hobbies is None:
+            hobbies = trending_hobbies(limit)
+            set_trending(limit, hobbies)
+        return JsonResponse(hobbies, safe=False)
+    return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
 @login_required
 def add_hobby(request):
     if request.method == "POST":
@@ -256,39 +419,30 @@ def signup(request):
                         'message': 'Invalid date format. Please use YYYY-MM-DD'
                     }, status=400)
             
-            user = CustomUser.objects.create_user(
-                email=email,
-                name=name,
-                password=password,
-                date_of_birth=parsed_date
-            )
-
-            for hobby_name in hobby_names:
-                hobby_name = hobby_name.strip()
-                if hobby_name:
-                    hobby, _ = Hobby.objects.get_or_create(name=hobby_name)
-                    user.hobbies.add(hobby)
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    email=email,
+                    name=name,
+                    password=password,
+                    date_of_birth=parsed_date
+                )
+                user_hobbies = Hobby.objects.get_or_create_many(hobby_names)
+                user.add_hobbies(user_hobbies)
             
             login(request, user)
 
-            user_data = {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
-                "hobbies": list(user.hobbies.values('id', 'name')),
-            }
-            return JsonResponse({
+            return snapshot_response({
                 'success': True, 
                 "message": "Successful Sign Up",
-                "user": user_data
-            })
+            }, "user", user_snapshot(user, user_hobbies))
             
         except json.JSONDecodeError:
             return JsonResponse({
                 'success': False, 
                 "message": "Invalid JSON data."
             }, status=400)
+        except HashingPoolSaturated:
+            return hashing_unavailable()
         except Exception as e:
             return JsonResponse({
                 'success': False, 
@@ -322,16 +476,11 @@ def user_login(request):
                     return JsonResponse({"success": False, "message": "User account is inactive."}, status=403)
 
                 login(request, user)
-                user_data = {
-                    "id": user.id,
-                    "name": user.name,
-                    "email": user.email,
-                    "date_of_birth": user.date_of_birth.isoformat() if user.date_of_birth else "",
-                    "hobbies": list(user.hobbies.values('id', 'name')),
-                }
-                return JsonResponse({"success": True, "message": "Successful Login.", "user": user_data})
+                return snapshot_response({"success": True, "message": "Successful Login."}, "user", user_snapshot(user))
             
             return JsonResponse({"success": False, "message": "Cannot Authenticate User"}, status=403)
+        except HashingPoolSaturated:
+            return hashing_unavailable()
         except Exception as e:
             print(f"Error in login: {e}")
             return JsonResponse({"success": False, "message": str(e)}, status=400)
@@ -342,60 +491,68 @@ def user_login(request):
 @login_required
 def similar_users(request):
     current_user = request.user
-    user_hobbies = set(current_user.hobbies.values_list('id', flat=True))
 
-    users = CustomUser.objects.exclude(id=current_user.id).annotate(
-        common_hobbies=Count('hobbies', filter=Q(hobbies__id__in=user_hobbies))
-    ).order_by('-common_hobbies')
+    cache_key = similar_users_key(current_user.id, request.GET)
+    cached = get_similar_users(cache_key)
+    if cached is not None:
+        return JsonResponse(cached)
 
-    age_min = request.GET.get('age_min')
-    age_max = request.GET.get('age_max')
-    today = date.today()
+    try:
+        ranked, mode, page_fields = rank_similar_users_page(current_user.id, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The page is cached for other requests too, so it is filled from the primary.
+    with primary_reads():
+        profiles = CustomUser.objects.only('id', 'name', 'date_of_birth').in_bulk([user_id for user_id, _, _ in ranked])
+        sent_request_ids = set(current_user.sent_requests.filter(
+            status='pending'
+        ).values_list('to_user_id', flat=True))
+        friend_ids = current_user.friend_ids()
+
+    response = {
+        'users': similar_users_data(ranked, mode, profiles, friend_ids, sent_request_ids),
+        **page_fields,
+    }
+    set_similar_users(cache_key, response)
+    return JsonResponse(response)
 
-    if age_min:
-        users = users.filter(date_of_birth__lte=today - timedelta(days=int(age_min)*365))
-    if age_max:
-        users = users.filter(date_of_birth__gte=today - timedelta(days=int(age_max)*365))
 
-    total_count = users.count()
+@login_required
+def list_friends(request):
+    user = request.user
+    friends = user.get_friends()
+    friends_data = [{'id': friend.id, 'name': friend.name, 'email': friend.email} for friend in friends]
+    return JsonResponse({'friends': friends_data}, safe=False)
+
 
-    page = int(request.GET.get('page', 1))
-    per_page = 9
-    start = (page - 1) * per_page
-    end = start + per_page
-    users_paginated = users[start:end]
+# "People you may know": friends of friends, ranked by mutual friends then shared hobbies
+@login_required
+def friend_suggestions(request):
+    user = request.user
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+    suggested = suggest_friends(user.id, limit)
 
-    friend_ids = set(current_user.friends.values_list('id', flat=True))
-    sent_request_ids = set(current_user.sent_requests.filter(
+    names = dict(CustomUser.objects.filter(id__in=[user_id for user_id, _, _ in suggested]).values_list('id', 'name'))
+    sent_request_ids = set(user.sent_requests.filter(
         status='pending'
     ).values_list('to_user_id', flat=True))
 
-    users_data = [
+    suggestions_data = [
         {
-            'id': user.id,
-            'name': user.name,
-            'common_hobbies': user.common_hobbies,
-            'age': (today - user.date_of_birth).days // 365 if user.date_of_birth else None,
-            'isFriend': user.id in friend_ids,
-            'requestSent': user.id in sent_request_ids,
+            'id': user_id,
+            'name': names[user_id],
+            'mutual_friends': mutual_friends,
+            'common_hobbies': common_hobbies,
+            'requestSent': user_id in sent_request_ids,
         }
-        for user in users_paginated
+        for user_id, mutual_friends, common_hobbies in suggested
+        if user_id in names
     ]
-
-    return JsonResponse({
-        'users': users_data,
-        'total_count': total_count,
-        'page': page,
-        'per_page': per_page
-    }, safe=False)
-
-
-@login_required
-def list_friends(request):
-    user = request.user
-    friends = user.friends.all()
-    friends_data = [{'id': friend.id, 'name': friend.name, 'email': friend.email} for friend in friends]
-    return JsonResponse({'friends': friends_data}, safe=False)
+    return JsonResponse({'suggestions': suggestions_data})
 
 
 @login_required
@@ -446,6 +603,63 @@ def reject_friend_request(request, request_id):
     return JsonResponse({'message': 'Friend request rejected!'})
 
 
+# Most ids one bulk call may carry, so a single request cannot hold row locks on an unbounded set
+BULK_MAX_IDS = 100
+# Largest value of a BigAutoField; bigger ints fail in the database driver instead of matching nothing
+_MAX_ID = 2 ** 63 - 1
+
+
+def _ids_from_body(request, key):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise ValueError("Invalid JSON data.")
+    ids = data.get(key) if isinstance(data, dict) else None
+    # bool is an int subclass, so true/false would otherwise pass as ids 1 and 0.
+    if not isinstance(ids, list) or not all(type(i) is int and 0 < i <= _MAX_ID for i in ids):
+        raise ValueError(f"'{key}' must be a list of ids.")
+    if len(ids) > BULK_MAX_IDS:
+        raise ValueError(f"'{key}' may hold at most {BULK_MAX_IDS} ids.")
+    return ids
+
+
+# Accept, reject or send many friend requests in one call; each id gets its own result
+@login_required
+@require_POST
+def accept_friend_requests(request):
+    try:
+        request_ids = _ids_from_body(request, 'request_ids')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    accepted = {fr.id for fr in FriendRequest.accept_many(request.user, request_ids)}
+    results = [{'id': i, 'status': 'accepted' if i in accepted else 'not_found'} for i in request_ids]
+    return JsonResponse({'results': results})
+
+
+@login_required
+@require_POST
+def reject_friend_requests(request):
+    try:
+        request_ids = _ids_from_body(request, 'request_ids')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rejected = {fr.id for fr in FriendRequest.reject_many(request.user, request_ids)}
+    results = [{'id': i, 'status': 'rejected' if i in rejected else 'not_found'} for i in request_ids]
+    return JsonResponse({'results': results})
+
+
+@login_required
+@require_POST
+def send_friend_requests(request):
+    try:
+        user_ids = _ids_from_body(request, 'user_ids')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    outcomes = FriendRequest.send_many(request.user, user_ids)
+    results = [{'id': i, 'status': outcomes[i]} for i in user_ids]
+    return JsonResponse({'results': results})
+
+
 def user_logout(request: HttpRequest) -> JsonResponse:
     if request.method == "POST":
         if not request.user.is_authenticated:
@@ -459,4 +673,11 @@ def user_logout(request: HttpRequest) -> JsonResponse:
     return JsonResponse({
         "success": False,
         "message": "Invalid request method"
-    }, status=405)
\ No newline at end of file
+    }, status=405)
+
+# Background job queue depth, failures and latency per kind, for staff
+@login_required
+def job_metrics(request: HttpRequest) -> JsonResponse:
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only."}, status=403)
+    return JsonResponse({"jobs": job_stats()})
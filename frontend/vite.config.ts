@@ -13,6 +13,8 @@ export default defineConfig(({ mode }) => ({
     build: {
         emptyOutDir: true,
         outDir: "../api/static/api/spa",
+        // .vite/manifest.json: Django reads the hashed entry files from it for its preload headers (api/spa.py).
+        manifest: true,
     },
     css: {
         postcss: {
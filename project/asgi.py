@@ -3,6 +3,11 @@ ASGI config for project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+HTTP goes to Django and WebSockets to the channels routes in api/routing.py.
+Serving through this module switches SERVER_MODE to "asgi", e.g.:
+
+    daphne project.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
 """
@@ -12,5 +17,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('DJANGO_SERVER_MODE', 'asgi')
+
+# Set up Django before importing the consumers, which use the ORM.
+django_application = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from api.routing import websocket_urlpatterns  # noqa: E402
 
-application = get_asgi_application()
+application = ProtocolTypeRouter({
+    "http": django_application,
+    "websocket": AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+})
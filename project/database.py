@@ -1,32 +1,149 @@
-import os
+"""
+Database configuration from environment variables.
+
+``DATABASE_ENGINE`` picks the backend (``postgresql`` by default, or
+``sqlite`` / ``mysql``). Connection details come from ``DATABASE_NAME``,
+``DATABASE_USER``, ``DATABASE_PASSWORD``, ``DATABASE_HOST`` and
+``DATABASE_PORT``. On OpenShift, host and port are also read from the
+``<DATABASE_SERVICE_NAME>_SERVICE_HOST`` / ``_SERVICE_PORT`` variables.
 
-from django.conf import settings
+Connection reuse:
 
+* ``DATABASE_POOL`` (``auto``, ``on`` or ``off``): Django's native
+  connection pool, available on PostgreSQL with psycopg 3 and psycopg_pool
+  installed. ``auto`` uses it when those are importable. It is sized by
+  ``DATABASE_POOL_MIN_SIZE`` / ``DATABASE_POOL_MAX_SIZE``, and
+  ``DATABASE_POOL_TIMEOUT`` is the seconds a request waits for a connection.
+* Otherwise connections persist for ``DATABASE_CONN_MAX_AGE`` seconds,
+  and ``DATABASE_CONN_HEALTH_CHECKS`` checks them before each reuse. Under
+  ASGI (``DJANGO_SERVER_MODE=asgi``) it defaults to 0: the ORM runs on
+  executor threads there, and every thread would keep a connection of its own.
+* ``DATABASE_STATEMENT_TIMEOUT`` (milliseconds, 0 to disable) caps every
+  statement on PostgreSQL and MySQL. It is meant for requests: ``migrate``,
+  ``seed`` and ``reconcile_hobby_counts`` lift it for their whole run with
+  ``disable_statement_timeout()``, as their statements span whole tables.
+
+SQLite (``DATABASE_ENGINE=sqlite``) defaults to ``db.sqlite3`` next to
+``manage.py`` and runs in WAL mode, so local benchmarks need no server.
+
+A read replica is configured by ``DATABASE_REPLICA_HOST`` (and optionally
+``DATABASE_REPLICA_PORT``, ``DATABASE_REPLICA_USER``,
+``DATABASE_REPLICA_PASSWORD``), or on SQLite by ``DATABASE_REPLICA_NAME``.
+Anything not given is taken from the primary. See ``project/replicas.py``.
+"""
+import os
+from importlib.util import find_spec
+from pathlib import Path
+
+# Not read from django.conf.settings: this module is imported while the settings load.
+BASE_DIR = Path(__file__).resolve().parent.parent
 
 engines = {
     'sqlite': 'django.db.backends.sqlite3',
-    'postgresql': 'django.db.backends.postgresql_psycopg2',
+    'postgresql': 'django.db.backends.postgresql',
     'mysql': 'django.db.backends.mysql',
 }
 
 
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _conn_max_age():
+    default = 0 if os.getenv('DJANGO_SERVER_MODE', 'wsgi') == 'asgi' else 60
+    return _env_int('DATABASE_CONN_MAX_AGE', default)
+
+
+def _lift_statement_timeout(sender, connection, **kwargs):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET statement_timeout = 0')
+    elif connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET SESSION max_execution_time = 0')
+
+
+def disable_statement_timeout():
+    """Lift ``DATABASE_STATEMENT_TIMEOUT`` on every connection this process has open or opens later."""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_lift_statement_timeout, dispatch_uid='disable_statement_timeout')
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            _lift_statement_timeout(type(connection), connection)
+
+
+def pool_available():
+    return find_spec('psycopg') is not None and find_spec('psycopg_pool') is not None
+
+
 def config():
+    engine = engines.get(os.getenv('DATABASE_ENGINE', 'postgresql'), engines['postgresql'])
+    if engine == engines['sqlite']:
+        return {
+            'ENGINE': engine,
+            'NAME': os.getenv('DATABASE_NAME') or str(BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': _conn_max_age(),
+            'CONN_HEALTH_CHECKS': _env_bool('DATABASE_CONN_HEALTH_CHECKS', True),
+            'OPTIONS': {
+                'timeout': 20,
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+        }
+
     service_name = os.getenv('DATABASE_SERVICE_NAME', '').upper().replace('-', '_')
-    if service_name:
-        engine = engines.get(os.getenv('DATABASE_ENGINE'), engines['postgresql'])
-    else:
-        engine = engines['postgresql']
-    name = os.getenv('DATABASE_NAME')
-    if not name and engine == engines['sqlite']:
-        name = os.path.join(settings.BASE_DIR, 'db.sqlite3')
-    return {
+    database = {
         'ENGINE': engine,
-        'NAME': 'default',
-        'USER': 'django',
-        'PASSWORD': 'pxviFo8wxSTGstTq',
-        'PORT': '5432',
-        'HOST': '10.137.255.43',
+        'NAME': os.getenv('DATABASE_NAME', 'default'),
+        'USER': os.getenv('DATABASE_USER', 'django'),
+        'PASSWORD': os.getenv('DATABASE_PASSWORD', 'pxviFo8wxSTGstTq'),
+        'HOST': os.getenv('DATABASE_HOST') or os.getenv(f'{service_name}_SERVICE_HOST') or '10.137.255.43',
+        'PORT': (os.getenv('DATABASE_PORT') or os.getenv(f'{service_name}_SERVICE_PORT')
+                 or ('3306' if engine == engines['mysql'] else '5432')),
+        'CONN_MAX_AGE': _conn_max_age(),
+        'CONN_HEALTH_CHECKS': _env_bool('DATABASE_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {},
         'TEST': {
             'NAME': 'test_yourmum',
         }
     }
+
+    statement_timeout = _env_int('DATABASE_STATEMENT_TIMEOUT', 30000)
+    if engine == engines['postgresql']:
+        if statement_timeout:
+            database['OPTIONS']['options'] = f'-c statement_timeout={statement_timeout}'
+        pool = os.getenv('DATABASE_POOL', 'auto').lower()
+        if pool == 'on' or (pool == 'auto' and pool_available()):
+            database['OPTIONS']['pool'] = {
+                'min_size': _env_int('DATABASE_POOL_MIN_SIZE', 2),
+                'max_size': _env_int('DATABASE_POOL_MAX_SIZE', 10),
+                'timeout': _env_int('DATABASE_POOL_TIMEOUT', 10),
+            }
+            # The pool keeps the connections; Django refuses persistent connections on top of it.
+            database['CONN_MAX_AGE'] = 0
+    elif engine == engines['mysql'] and statement_timeout:
+        database['OPTIONS']['init_command'] = f'SET SESSION max_execution_time={statement_timeout}'
+    return database
+
+
+def replica_config():
+    """The ``replica`` alias, or None when no replica is configured."""
+    primary = config()
+    if primary['ENGINE'] == engines['sqlite']:
+        if not os.getenv('DATABASE_REPLICA_NAME'):
+            return None
+        overrides = {'NAME': os.getenv('DATABASE_REPLICA_NAME')}
+    else:
+        if not os.getenv('DATABASE_REPLICA_HOST'):
+            return None
+        overrides = {
+            key: os.getenv(f'DATABASE_REPLICA_{key}') or primary[key]
+            for key in ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+        }
+    # Tests have no replication, so the test runner points the replica at the test primary.
+    return {**primary, **overrides, 'TEST': {**primary.get('TEST', {}), 'MIRROR': 'default'}}
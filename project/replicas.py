@@ -0,0 +1,119 @@
+"""
+Read replica routing.
+
+When ``DATABASES`` has a ``replica`` alias, ``ReplicaMiddleware`` marks
+GET, HEAD and OPTIONS requests as replica-safe and ``ReplicaRouter`` sends
+their reads there. Everything else goes to ``default``: writes, reads
+inside a transaction, reads after the request has written, and all work
+outside a request (management commands, signal handlers run on commit).
+
+A client that has written is pinned to the primary for
+``REPLICA_PIN_SECONDS`` through a cookie, so it reads its own writes even
+while the replica lags behind. Code that fills shared caches reads inside
+``primary_reads()``: what it caches is served to every client, pinned or not.
+
+For local testing, point ``DATABASE_REPLICA_NAME`` at a copy of the SQLite
+file (or ``DATABASE_REPLICA_HOST`` at a second Postgres). Django's test
+runner mirrors the replica onto ``default``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+# Per request: whether reads may go to the replica, and whether the request has written.
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote_to_primary', default=None)
+
+
+def has_replica():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads of the block to ``default``."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        wrote = _wrote.get()
+        if wrote is not None and wrote[0]:
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            wrote[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication.
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        # A list, so writes made in sync_to_async threads are seen here too.
+        wrote = [False]
+        tokens = (_replica_reads.set(has_replica() and safe and not pinned), _wrote.set(wrote))
+        return wrote, tokens
+
+    def _reset(self, tokens):
+        _replica_reads.reset(tokens[0])
+        _wrote.reset(tokens[1])
+
+    def _pin(self, response, wrote):
+        if wrote[0] and has_replica():
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        wrote, tokens = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._pin(response, wrote)
+
+    async def __acall__(self, request):
+        wrote, tokens = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._pin(response, wrote)
@@ -47,20 +47,28 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'api.apps.ApiConfig',
     'corsheaders',
+    'channels',
 ]
  
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'project.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.HashingPoolSaturatedMiddleware',
+    'api.middleware.WhiteNoiseMiddleware',
 ]
  
+# Besides staff users, scrapers sending "Authorization: Bearer <token>" may read /metrics
+# (api/metrics.py). Unset, only staff users may.
+METRICS_TOKEN = os.getenv('DJANGO_METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'project.urls'
  
 TEMPLATES = [
@@ -80,6 +88,11 @@ TEMPLATES = [
 ]
  
 WSGI_APPLICATION = 'project.wsgi.application'
+ASGI_APPLICATION = 'project.asgi.application'
+
+# "wsgi" or "asgi". project/asgi.py sets DJANGO_SERVER_MODE=asgi, which serves
+# the read-heavy endpoints from the native async views in api/async_views.py.
+SERVER_MODE = os.getenv('DJANGO_SERVER_MODE', 'wsgi')
  
  
 # Database
@@ -89,6 +102,9 @@ WSGI_APPLICATION = 'project.wsgi.application'
 DATABASES = {
     'default': database.config()
 }
+replica = database.replica_config()
+if replica:
+    DATABASES['replica'] = replica
  
  
 # Password validation
@@ -168,7 +184,7 @@ CSRF_COOKIE_NAME = 'csrftoken'
  
 SESSION_COOKIE_SECURE = False
  
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+SESSION_ENGINE = "api.sessions"
 SESSION_COOKIE_AGE = 604800 
 SESSION_SAVE_EVERY_REQUEST = True
  
@@ -177,4 +193,105 @@ AUTH_USER_MODEL = 'api.CustomUser'
  
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Default backend
-]
\ No newline at end of file
+]
+
+# The default cache holds similar_users results and their generation tokens.
+# With more than one worker process, point this at a shared backend (Redis,
+# Memcached) so that evictions reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Seconds a cached similar_users response may be served for.
+SIMILAR_USERS_CACHE_TIMEOUT = 60
+
+# Seconds before a worker rebuilds its in-memory hobby index from the database.
+# Writes made by this worker are applied incrementally; the rebuild lets other
+# workers pick up writes they did not see.
+SIMILARITY_INDEX_MAX_AGE = 300
+
+# Minimum seconds between rebuilds of the array snapshot used for Jaccard and
+# cosine scoring in similar_users.
+SIMILARITY_VECTORS_REFRESH = 5
+
+# MinHash/LSH banding for the approximate similar_users mode (?approx=1), and
+# the minimum seconds between rebuilds of its buckets.
+SIMILARITY_LSH_BANDS = 32
+SIMILARITY_LSH_ROWS = 2
+SIMILARITY_LSH_REFRESH = 60
+
+# Friend graph snapshot behind friends/suggestions/: rebuilt after this many
+# seconds, or once this many incremental edge changes have piled up.
+FRIEND_GRAPH_MAX_AGE = 300
+FRIEND_GRAPH_MAX_OVERLAY = 10000
+
+# Seconds before the hobby autocomplete index is reloaded from the database.
+HOBBY_SEARCH_MAX_AGE = 3600
+
+# Seconds the hobby catalogue version and its pre-serialized body are cached.
+HOBBY_CATALOGUE_TIMEOUT = 60
+
+# Write-coalescing session backend (api.sessions). Expiry refreshes are only
+# written once this fraction of SESSION_COOKIE_AGE has passed, and in batches.
+SESSION_LOCAL_CACHE_SIZE = 10000
+SESSION_LOCAL_CACHE_TTL = 5
+SESSION_REFRESH_FRACTION = 0.1
+SESSION_EXPIRY_BATCH_SIZE = 100
+SESSION_EXPIRY_FLUSH_INTERVAL = 5
+
+# Seconds a user's pre-serialized profile snapshot is cached.
+USER_SNAPSHOT_TIMEOUT = 300
+
+# PBKDF2 runs on a pool of PASSWORD_HASHING_WORKERS processes (0 hashes
+# inline). Logins, signups and password changes get a 503 once more than
+# PASSWORD_HASHING_MAX_QUEUE hashes are waiting, or after the timeout.
+# Django's own PBKDF2PasswordHasher must not be listed as well: it shares the
+# pbkdf2_sha256 algorithm name and would take over password checks.
+PASSWORD_HASHERS = [
+    'api.hashers.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_MAX_QUEUE = 16
+PASSWORD_HASHING_TIMEOUT = 5
+
+# Channel layer behind the WebSocket notifications (api/consumers.py). The
+# in-memory layer needs no Redis but only reaches sockets in the same process.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# Safe-method reads go to DATABASES['replica'] when one is configured
+# (project/replicas.py). A client that writes is pinned to the primary for
+# REPLICA_PIN_SECONDS, which should exceed the worst replication lag.
+DATABASE_ROUTERS = ['project.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+# Trending hobbies (api/trending.py): adds are counted per bucket, buffered for
+# up to TRENDING_FLUSH_INTERVAL seconds per process, and summed over the last
+# TRENDING_WINDOW seconds.
+TRENDING_BUCKET_SECONDS = 3600
+TRENDING_WINDOW = 86400
+TRENDING_FLUSH_INTERVAL = 10
+TRENDING_CACHE_TIMEOUT = 60
+
+# Background jobs (api/jobs.py). By default each process runs the jobs it
+# queues in a thread; set DJANGO_JOB_IN_PROCESS_WORKER=0 when `manage.py
+# runworker` processes run them instead. Failed batches are retried after
+# JOB_RETRY_BACKOFF * 2 ** (attempt - 1) seconds.
+JOB_IN_PROCESS_WORKER = os.getenv('DJANGO_JOB_IN_PROCESS_WORKER', '1') == '1'
+JOB_POLL_INTERVAL = 5
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_LEASE_SECONDS = 300
+JOB_RETENTION = 3600
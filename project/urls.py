@@ -18,10 +18,13 @@ from django.contrib import admin
 from django.urls import include, path
 from django.http import HttpResponse
 
+from api.metrics import metrics
+
 
 urlpatterns = [
     path('', include('api.urls')),
     path('health', lambda request: HttpResponse("OK")),
+    path('metrics', metrics),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls'))
 ]